@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+"""Benchmarks for Hiragana G2P.
+
+Measures grammar build time, cold (uncached) and warm (cached) per-word
+latency percentiles for `g2p.g2p`, batch throughput, the build time, size and
+cold latency of each build profile, peak RSS, and the memory each worker
+process needs for the grammar in each runtime mode, over the words of a TSV
+or word list file (by default, `jpd.tsv`), or of a synthetic corpus given as
+"synthetic:N[:SEED]" for load testing; see `corpus`. Results are written as
+JSON, and optionally compared against a stored baseline; the exit status is
+nonzero if any metric regressed by more than its threshold.
+
+Timings are only comparable on one host, so the baseline is not checked in:
+write it with --update-baseline on each host, from the tree to compare
+against, and regenerate it whenever the host or its load changes.
+
+With --stages, instead reports the compile and composition time and size of
+each stage of the rule cascade; with --scaling, how batch throughput scales
+across threads and processes.
+"""
+
+import argparse
+import collections
+import functools
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import bulk
+import g2p
+import tables
+
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json"
+)
+THRESHOLD = 0.25
+
+# Per-word latencies, in microseconds, follow the load and clock speed of the
+# host more closely than whole-corpus timings do, so they are given a wider
+# threshold.
+LATENCY_THRESHOLD = 0.5
+
+# A warm call is a memo cache hit, well under a microsecond, so timer overhead
+# is a large part of what is measured.
+WARM_THRESHOLD = 1.0
+
+# Metrics which are reported but not compared against the baseline: over a
+# corpus of a few hundred words, a p99 is one of its slowest few samples.
+UNGATED_SUFFIXES = ("_p99_us",)
+
+# Metrics for which a larger value is an improvement; for all others, smaller
+# is better.
+HIGHER_IS_BETTER = frozenset(["batch_words_per_sec", "engine_words_per_sec"])
+
+# The shortest timed run of a throughput benchmark; see `_rounds`.
+MIN_RUN_S = 0.2
+
+
+def _threshold(name: str, threshold: float) -> float:
+    """Returns the largest tolerated relative regression of a metric."""
+    if name.startswith("warm_"):
+        return WARM_THRESHOLD
+    if name.endswith("_us"):
+        return LATENCY_THRESHOLD
+    return threshold
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _latencies(words: Sequence[str], function: Callable) -> List[float]:
+    latencies = []
+    for word in words:
+        start = time.perf_counter()
+        try:
+            function(word)
+        except Exception:
+            pass
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _summarize(
+    prefix: str, passes: Sequence[Sequence[float]]
+) -> Dict[str, float]:
+    """Summarizes latencies as the median of each percentile over passes."""
+    return {
+        f"{prefix}_p{round(fraction * 100)}_us": round(
+            statistics.median(
+                _percentile(latencies, fraction) for latencies in passes
+            )
+            * 1e6,
+            3,
+        )
+        for fraction in (0.5, 0.9, 0.99)
+    }
+
+
+def _rounds(words: Sequence[str], function: Callable) -> int:
+    """Returns how many times to pass the corpus to a throughput benchmark.
+
+    Small corpora are transcribed repeatedly, so that each timed run lasts at
+    least `MIN_RUN_S`.
+    """
+    rounds = 1
+    while True:
+        if _time(words, function, rounds) >= MIN_RUN_S:
+            return rounds
+        rounds *= 2
+
+
+def _time(words: Sequence[str], function: Callable, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(words)
+    return time.perf_counter() - start
+
+
+def _transcribe_each(transcribe: Callable, words: Sequence[str]) -> None:
+    for word in words:
+        try:
+            transcribe(word)
+        except Exception:
+            pass
+
+
+def _anonymous_kb() -> Optional[int]:
+    """Returns this process's anonymous memory, which cannot be shared."""
+    try:
+        with open("/proc/self/smaps_rollup", "r") as source:
+            for line in source:
+                if line.startswith("Anonymous:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# Run in a fresh interpreter by `worker_anonymous_kb`.
+_WORKER_PROBE = """
+import sys
+import bench, g2p
+g2p.set_mode(sys.argv[1])
+g2p.set_cache_size(0)
+g2p.warmup()
+for word in bench.bulk.read_words(sys.argv[2]):
+    try:
+        g2p.g2p(word)
+    except g2p.rewrite.Error:
+        pass
+print(bench._anonymous_kb())
+"""
+
+
+def worker_anonymous_kb(mode: str, corpus: str) -> Optional[int]:
+    """Measures the unshareable memory of a worker process.
+
+    A fresh interpreter loads the grammar in the given mode and transcribes
+    the corpus, then reports its anonymous memory: what each additional worker
+    process costs. Memory-mapped file pages, as used in "engine" mode, are
+    not included, since all processes on a host share them.
+
+    Args:
+      mode: one of `g2p.MODES`.
+      corpus: the corpus, as given to `bulk.read_words`.
+
+    Returns:
+      The anonymous memory in kilobytes, or None if it cannot be measured
+      here.
+    """
+    if _anonymous_kb() is None:
+        return None
+    process = subprocess.run(
+        [sys.executable, "-c", _WORKER_PROBE, mode, corpus],
+        capture_output=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        encoding="utf8",
+    )
+    return int(process.stdout)
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run(
+    words: Sequence[str], repeats: int = 10, corpus: Optional[str] = None
+) -> Dict[str, float]:
+    """Runs the benchmarks.
+
+    Each timed operation is repeated, and the repeats are interleaved, so that
+    a passing burst of load on the host affects only some runs of each. Build
+    times and throughputs are the fastest of the runs, and each latency
+    percentile is the median over the passes. The profiles are built and
+    timed in memory, so the saved grammar is left as it is.
+
+    Args:
+      words: the corpus.
+      repeats: how many times each timed operation is repeated.
+      corpus: the file the corpus was read from, or its synthetic corpus
+        specification; if given, the per-process memory cost of each runtime
+        mode is also measured.
+
+    Returns:
+      A mapping from metric names to values.
+    """
+    g2p.warmup()
+    engine = g2p.compile_engine()
+    transcribers = {
+        "batch": g2p.g2p_batch,
+        "engine": functools.partial(_transcribe_each, engine.transcribe),
+    }
+    rounds = {
+        name: _rounds(words, function)
+        for name, function in transcribers.items()
+    }
+    times: Dict[str, List[float]] = collections.defaultdict(list)
+    passes: Dict[str, List[List[float]]] = collections.defaultdict(list)
+    sizes: Dict[str, int] = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        g2p.build()
+        times["build"].append(time.perf_counter() - start)
+        g2p.cache_clear()
+        passes["cold"].append(_latencies(words, g2p.g2p))
+        passes["warm"].append(_latencies(words, g2p.g2p))
+        for name, function in transcribers.items():
+            times[name].append(_time(words, function, rounds[name]))
+        for name in g2p.PROFILES:
+            start = time.perf_counter()
+            fst = g2p.build(profile=name)
+            times[f"{name}_build"].append(time.perf_counter() - start)
+            sizes[f"{name}_states"] = fst.num_states()
+            sizes[f"{name}_arcs"] = sum(
+                fst.num_arcs(state) for state in fst.states()
+            )
+            passes[f"{name}_cold"].append(
+                _latencies(words, functools.partial(g2p.apply_grammar, fst))
+            )
+    results: Dict[str, float] = {}
+    for name, durations in times.items():
+        if name in transcribers:
+            results[f"{name}_words_per_sec"] = round(
+                rounds[name] * len(words) / min(durations), 1
+            )
+        else:
+            results[f"{name}_s"] = round(min(durations), 6)
+    results.update(sizes)
+    for name, latencies in passes.items():
+        results.update(_summarize(name, latencies))
+    results["peak_rss_kb"] = _peak_rss_kb()
+    if corpus is not None:
+        # Ensures the compiled artifacts exist, so that they are only loaded.
+        g2p.compiled_engine()
+        for mode in ("composed", "engine"):
+            kb = worker_anonymous_kb(mode, corpus)
+            if kb is not None:
+                results[f"{mode}_worker_anon_kb"] = kb
+        results["engine_shared_kb"] = os.path.getsize(g2p.ENGINE_PATH) // 1024
+    return results
+
+
+def compare(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    threshold: float = THRESHOLD,
+) -> List[str]:
+    """Compares results against a baseline.
+
+    Per-word latencies are compared against `LATENCY_THRESHOLD`, or for warm
+    calls `WARM_THRESHOLD`, rather than the given threshold, and metrics
+    ending in one of `UNGATED_SUFFIXES` are not compared at all.
+
+    Args:
+      results: the current metrics.
+      baseline: the baseline metrics.
+      threshold: the largest tolerated relative regression of other metrics.
+
+    Returns:
+      A description of each metric which regressed by more than its
+      threshold.
+    """
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        actual = results.get(name)
+        if actual is None or not expected or name.endswith(UNGATED_SUFFIXES):
+            continue
+        if name in HIGHER_IS_BETTER:
+            change = (expected - actual) / expected
+        else:
+            change = (actual - expected) / expected
+        if change > _threshold(name, threshold):
+            regressions.append(
+                f"{name}: {actual} vs. baseline {expected} "
+                f"({change:+.0%} worse)"
+            )
+    return regressions
+
+
+def format_stats(stats: Sequence[g2p.StageStats]) -> str:
+    """Formats per-stage build statistics as a table.
+
+    Args:
+      stats: the statistics, as returned by `g2p.build_stats`.
+
+    Returns:
+      The table.
+    """
+    header = (
+        "stage",
+        "compile ms",
+        "compose ms",
+        "states",
+        "arcs",
+        "opt. states",
+        "opt. arcs",
+    )
+    rows = [header] + [
+        (
+            row.name,
+            f"{row.compile_s * 1000:.1f}",
+            f"{row.compose_s * 1000:.1f}",
+            str(row.states),
+            str(row.arcs),
+            str(row.optimized_states),
+            str(row.optimized_arcs),
+        )
+        for row in stats
+    ]
+    return tables.format_table(rows, right=range(1, len(header)))
+
+
+def scaling(
+    words: Sequence[str], max_workers: int, repeats: int = 3
+) -> List[Dict[str, float]]:
+    """Measures batch throughput across 1 to N threads and processes.
+
+    Threads use `g2p.g2p_batch` with a thread pool; processes use
+    `bulk.transcribe`, including the time to start the pool.
+
+    Args:
+      words: the corpus.
+      max_workers: the largest number of threads and processes.
+      repeats: how many times each run is repeated; the fastest is reported.
+
+    Returns:
+      For each number of workers, the words per second with that many
+      threads and processes.
+    """
+    g2p.warmup()
+    rows = []
+    for workers in range(1, max_workers + 1):
+        thread_times = []
+        process_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            g2p.g2p_batch(words, threads=workers)
+            thread_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in bulk.transcribe(words, workers):
+                pass
+            process_times.append(time.perf_counter() - start)
+        rows.append(
+            {
+                "workers": workers,
+                "threads_words_per_sec": round(
+                    len(words) / min(thread_times), 1
+                ),
+                "processes_words_per_sec": round(
+                    len(words) / min(process_times), 1
+                ),
+            }
+        )
+    return rows
+
+
+def format_scaling(rows: Sequence[Dict[str, float]]) -> str:
+    """Formats the results of `scaling` as a table."""
+    return tables.format_table(
+        [("workers", "threads words/s", "processes words/s")]
+        + [
+            (
+                str(row["workers"]),
+                f"{row['threads_words_per_sec']:.0f}",
+                f"{row['processes_words_per_sec']:.0f}",
+            )
+            for row in rows
+        ]
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--corpus",
+        default=JPD_PATH,
+        help="TSV or word list file, or synthetic:N[:SEED]",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=10, help="repeats per timed operation"
+    )
+    parser.add_argument("--output", help="write results here, not stdout")
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="baseline results file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="largest tolerated relative regression of metrics other than "
+        "per-word latencies",
+    )
+    parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="report per-stage build statistics instead, as a table",
+    )
+    parser.add_argument(
+        "--scaling",
+        type=int,
+        metavar="N",
+        help="report batch throughput with 1 to N threads and processes "
+        "instead, as a table",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="with --stages or --scaling, report the results as JSON",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="overwrite the baseline with these results; run this on each "
+        "host before comparing against it",
+    )
+    args = parser.parse_args()
+    if args.stages:
+        stats = g2p.build_stats()
+        print(
+            json.dumps([row._asdict() for row in stats], indent=2)
+            if args.json
+            else format_stats(stats)
+        )
+        return 0
+    if args.scaling:
+        rows = scaling(
+            list(bulk.read_words(args.corpus)), args.scaling, args.repeats
+        )
+        print(
+            json.dumps(rows, indent=2) if args.json else format_scaling(rows)
+        )
+        return 0
+    results = run(
+        list(bulk.read_words(args.corpus)), args.repeats, args.corpus
+    )
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as sink:
+            sink.write(report + "\n")
+    else:
+        print(report)
+    if args.update_baseline:
+        with open(args.baseline, "w") as sink:
+            sink.write(report + "\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(
+            f"No baseline at {args.baseline}; write one for this host with "
+            "--update-baseline",
+            file=sys.stderr,
+        )
+        return 0
+    with open(args.baseline, "r") as source:
+        baseline = json.load(source)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Unit tests for the benchmarks."""
+
+import os
+import unittest
+
+import bench
+import g2p
+
+
+class CompareTest(unittest.TestCase):
+    def test_compare(self) -> None:
+        baseline = {"build_s": 1.0, "batch_words_per_sec": 1000.0}
+        self.assertEqual(
+            bench.compare(
+                {"build_s": 1.2, "batch_words_per_sec": 800.0}, baseline
+            ),
+            [],
+        )
+        regressions = bench.compare(
+            {"build_s": 1.5, "batch_words_per_sec": 500.0}, baseline
+        )
+        self.assertEqual(len(regressions), 2)
+
+    def test_noisy_metrics(self) -> None:
+        baseline = {
+            "cold_p50_us": 100.0,
+            "cold_p99_us": 100.0,
+            "warm_p50_us": 0.5,
+        }
+        self.assertEqual(
+            bench.compare(
+                {
+                    "cold_p50_us": 140.0,
+                    "cold_p99_us": 500.0,
+                    "warm_p50_us": 0.9,
+                },
+                baseline,
+            ),
+            [],
+        )
+        self.assertEqual(
+            len(
+                bench.compare(
+                    {"cold_p50_us": 160.0, "warm_p50_us": 1.5}, baseline
+                )
+            ),
+            2,
+        )
+
+    def test_run(self) -> None:
+        g2p.warmup()
+        far_mtime = os.stat(g2p.FAR_PATH).st_mtime_ns
+        results = bench.run(["じか", "げんか", "abc"], repeats=1)
+        for name in ("build_s", "cold_p50_us", "warm_p99_us", "peak_rss_kb"):
+            self.assertGreater(results[name], 0)
+        for name in g2p.PROFILES:
+            self.assertGreater(results[f"{name}_cold_p50_us"], 0)
+        self.assertEqual(os.stat(g2p.FAR_PATH).st_mtime_ns, far_mtime)
+
+    def test_scaling(self) -> None:
+        rows = bench.scaling(["じか", "げんか", "abc"], 2, repeats=1)
+        self.assertEqual([row["workers"] for row in rows], [1, 2])
+        self.assertIn("threads", bench.format_scaling(rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
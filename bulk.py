@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Bulk transcription of word lists across a process pool.
+
+The input is either a TSV file like `jpd.tsv`, whose first column is used, a
+plain file with one word per line, or a synthetic corpus; see `read_words`.
+The output is a TSV file of each word and its transcription, in input order;
+words which cannot be transcribed have an empty transcription.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import sys
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import corpus
+import g2p
+import lexicon
+
+CHUNK_SIZE = 1024
+
+# Marks a synthetic corpus in place of an input path; see `read_words`.
+SYNTHETIC_PREFIX = "synthetic:"
+
+
+def read_words(path: str) -> Iterator[str]:
+    """Yields the words in a word list or TSV file.
+
+    A path of the form "synthetic:N" or "synthetic:N:SEED" instead yields a
+    synthetic corpus of N words, generated by `corpus.generate`.
+
+    Args:
+      path: the input path.
+
+    Yields:
+      The first column of each non-empty line.
+
+    Raises:
+      ValueError: a synthetic corpus specification is malformed.
+    """
+    if path.startswith(SYNTHETIC_PREFIX):
+        count, _, seed = path[len(SYNTHETIC_PREFIX) :].partition(":")
+        yield from corpus.generate(int(count), int(seed or 0))
+        return
+    yield from lexicon.read_words(path)
+
+
+def _chunks(words: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(words)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _transcribe_chunk(words: List[str]) -> List[Tuple[str, Optional[str]]]:
+    return [
+        (word, None if isinstance(result, g2p.rewrite.Error) else result)
+        for word, result in zip(words, g2p.g2p_batch(words))
+    ]
+
+
+def transcribe(
+    words: Iterable[str],
+    processes: Optional[int] = None,
+    chunksize: int = CHUNK_SIZE,
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Transcribes words across a process pool.
+
+    Each worker loads the grammar once, when it starts.
+
+    Args:
+      words: the graphemic input strings.
+      processes: the number of worker processes; defaults to the CPU count.
+      chunksize: the number of words sent to a worker at a time.
+
+    Yields:
+      (word, transcription) pairs in input order; the transcription is None if
+      the word could not be transcribed.
+    """
+    with multiprocessing.Pool(processes, initializer=g2p.warmup) as pool:
+        for chunk in pool.imap(_transcribe_chunk, _chunks(words, chunksize)):
+            yield from chunk
+
+
+def transcribe_file(
+    ipath: str,
+    opath: str,
+    processes: Optional[int] = None,
+    chunksize: int = CHUNK_SIZE,
+) -> int:
+    """Transcribes a word list to a TSV file.
+
+    Args:
+      ipath: the input word list or TSV path.
+      opath: the output TSV path.
+      processes: the number of worker processes; defaults to the CPU count.
+      chunksize: the number of words sent to a worker at a time.
+
+    Returns:
+      The number of words which could not be transcribed.
+    """
+    failures = 0
+    with open(opath, "w", encoding="utf8") as sink:
+        for word, ostring in transcribe(
+            read_words(ipath), processes, chunksize
+        ):
+            if ostring is None:
+                failures += 1
+                ostring = ""
+            sink.write(f"{word}\t{ostring}\n")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "input", help="word list or TSV file, or synthetic:N[:SEED]"
+    )
+    parser.add_argument("output", help="output TSV file")
+    parser.add_argument(
+        "--processes", type=int, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=CHUNK_SIZE,
+        help="words sent to a worker at a time",
+    )
+    args = parser.parse_args()
+    failures = transcribe_file(
+        args.input, args.output, args.processes, args.chunksize
+    )
+    if failures:
+        print(f"{failures} words could not be transcribed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
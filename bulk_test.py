@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Unit tests for bulk transcription."""
+
+import os
+import tempfile
+import unittest
+
+import bulk
+import corpus
+import g2p
+
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
+
+
+class BulkTest(unittest.TestCase):
+    def test_transcribe_file(self) -> None:
+        words = list(bulk.read_words(JPD_PATH))
+        with tempfile.TemporaryDirectory() as tempdir:
+            ipath = os.path.join(tempdir, "words.txt")
+            opath = os.path.join(tempdir, "out.tsv")
+            with open(ipath, "w", encoding="utf8") as sink:
+                sink.write("\n".join(words + ["abc"]) + "\n")
+            failures = bulk.transcribe_file(ipath, opath, 2, chunksize=16)
+            with open(opath, "r", encoding="utf8") as source:
+                rows = [line.rstrip("\n").split("\t") for line in source]
+        self.assertEqual(failures, 1)
+        self.assertEqual(rows[-1], ["abc", ""])
+        self.assertEqual(rows[:-1], [[word, g2p.g2p(word)] for word in words])
+
+    def test_read_synthetic_words(self) -> None:
+        words = list(bulk.read_words("synthetic:100:7"))
+        self.assertEqual(len(words), 100)
+        self.assertEqual(words, list(corpus.generate(100, 7)))
+        self.assertEqual(
+            list(bulk.read_words("synthetic:10")),
+            list(corpus.generate(10)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Synthetic hiragana corpora for load and scaling tests.
+
+Words are sampled from a mora n-gram model. Morae are the kana of
+`g2p.graphemes`, with a small ゃ, ゅ or ょ joined to the kana before it. The
+model's statistics are estimated from a training corpus (by default,
+`jpd.tsv`) and smoothed toward the mora unigram distribution, so that every
+mora can occur in any context. The number of morae in each word is drawn from
+a length distribution, by default that of the training corpus. Words are
+always well-formed, as `g2p.normalize` checks them: っ is never last, nor
+followed by a mora with no onset.
+
+Sampling is seeded, so the same seed and model always give the same corpus.
+Run this module to write a corpus, or pass "synthetic:N" or
+"synthetic:N:SEED" as the corpus to anything which reads words with
+`bulk.read_words`.
+"""
+
+import argparse
+import bisect
+import collections
+import os
+import random
+import sys
+from typing import (
+    Counter,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import g2p
+import lexicon
+
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
+
+# The mora inventory: each kana other than the small ones, and each digraph.
+MORAE = sorted((g2p.GRAPHEME_SET - g2p.YOON_SET) | g2p.DIGRAPHS)
+
+# Pads the context at the start of a word.
+_BOS = ""
+
+# A sampling table: the morae, their cumulative weights, and the total.
+_Table = Tuple[List[str], List[float], float]
+
+
+def morae(word: str) -> List[str]:
+    """Splits well-formed hiragana into morae.
+
+    Args:
+      word: the graphemic string, as normalized by `g2p.normalize`.
+
+    Returns:
+      The morae.
+    """
+    result: List[str] = []
+    for char in word:
+        if char in g2p.YOON_SET and result:
+            result[-1] += char
+        else:
+            result.append(char)
+    return result
+
+
+def _allowed(mora: str, after_sokuon: bool, final: bool) -> bool:
+    if final and mora == g2p.SOKUON:
+        return False
+    return not (after_sokuon and mora[0] in g2p.UNGEMINABLE)
+
+
+def parse_lengths(spec: str) -> Dict[int, float]:
+    """Parses a length distribution such as "2:1,3:4,4:4,5:2".
+
+    Args:
+      spec: comma-separated length:weight pairs, lengths in morae.
+
+    Returns:
+      The weight of each length.
+
+    Raises:
+      ValueError: the specification is malformed, or has no positive weight.
+    """
+    lengths: Dict[int, float] = {}
+    for pair in spec.split(","):
+        length, _, weight = pair.partition(":")
+        if int(length) < 1 or float(weight) < 0:
+            raise ValueError(f"Invalid length distribution: {spec!r}")
+        lengths[int(length)] = float(weight)
+    if not any(lengths.values()):
+        raise ValueError(f"Invalid length distribution: {spec!r}")
+    return lengths
+
+
+class MoraModel:
+    """A mora n-gram model for sampling words.
+
+    Args:
+      words: the training corpus; words which are not well-formed hiragana
+        are skipped.
+      order: the n-gram order.
+      smoothing: how much the unigram distribution counts in each context,
+        in pseudo-counts.
+      lengths: the weight of each word length, in morae; defaults to the
+        distribution of lengths in the training corpus.
+
+    Raises:
+      ValueError: there is no length distribution.
+    """
+
+    def __init__(
+        self,
+        words: Iterable[str],
+        order: int = 2,
+        smoothing: float = 1.0,
+        lengths: Optional[Dict[int, float]] = None,
+    ):
+        if order < 1:
+            raise ValueError(f"Invalid order: {order}")
+        self.order = order
+        self._counts: Dict[Tuple[str, ...], Counter[str]] = (
+            collections.defaultdict(collections.Counter)
+        )
+        unigrams: Counter[str] = collections.Counter()
+        observed: Counter[int] = collections.Counter()
+        for word in words:
+            try:
+                normalized = g2p.normalize(word)
+            except g2p.InputError:
+                continue
+            sequence = morae(normalized)
+            if not sequence:
+                continue
+            observed[len(sequence)] += 1
+            padded = [_BOS] * (order - 1) + sequence
+            for i, mora in enumerate(sequence):
+                self._counts[tuple(padded[i : i + order - 1])][mora] += 1
+                unigrams[mora] += 1
+        total = sum(unigrams.values()) + len(MORAE)
+        self._prior = {
+            mora: smoothing * (unigrams[mora] + 1) / total for mora in MORAE
+        }
+        if lengths is None:
+            lengths = dict(observed)
+        if not any(weight > 0 for weight in lengths.values()):
+            raise ValueError("No word lengths to sample from")
+        self.lengths = dict(sorted(lengths.items()))
+        self._tables: Dict[Tuple[Tuple[str, ...], bool, bool], _Table] = {}
+
+    def _table(
+        self, context: Tuple[str, ...], after_sokuon: bool, final: bool
+    ) -> _Table:
+        counts = self._counts.get(context, {})
+        choices = []
+        cumulative = []
+        total = 0.0
+        for mora in MORAE:
+            if _allowed(mora, after_sokuon, final):
+                total += counts.get(mora, 0) + self._prior[mora]
+                choices.append(mora)
+                cumulative.append(total)
+        # Guards against rounding up to the total when sampling.
+        cumulative[-1] = float("inf")
+        table = self._tables[context, after_sokuon, final] = (
+            choices,
+            cumulative,
+            total,
+        )
+        return table
+
+    def sample(self, count: int, seed: int = 0) -> Iterator[str]:
+        """Samples words.
+
+        Args:
+          count: the number of words.
+          seed: the random seed.
+
+        Yields:
+          The words.
+        """
+        rng = random.Random(seed)
+        uniform = rng.random
+        lengths = list(self.lengths)
+        cumulative = []
+        total = 0.0
+        for weight in self.lengths.values():
+            total += weight
+            cumulative.append(total)
+        cumulative[-1] = float("inf")
+        start = (_BOS,) * (self.order - 1)
+        width = self.order - 1
+        tables = self._tables
+        sokuon = g2p.SOKUON
+        for _ in range(count):
+            length = lengths[bisect.bisect(cumulative, uniform() * total)]
+            context = start
+            mora = _BOS
+            word = []
+            for i in range(length):
+                key = (context, mora == sokuon, i == length - 1)
+                table = tables.get(key)
+                if table is None:
+                    table = self._table(*key)
+                choices, weights, mass = table
+                mora = choices[bisect.bisect(weights, uniform() * mass)]
+                word.append(mora)
+                if width:
+                    context = context[1:] + (mora,)
+            yield "".join(word)
+
+
+_default_model: Optional[MoraModel] = None
+
+
+def default_model() -> MoraModel:
+    """Returns the model trained on `jpd.tsv` with the default settings."""
+    global _default_model
+    if _default_model is None:
+        _default_model = MoraModel(lexicon.read_words(JPD_PATH))
+    return _default_model
+
+
+def generate(
+    count: int, seed: int = 0, model: Optional[MoraModel] = None
+) -> Iterator[str]:
+    """Generates a synthetic corpus.
+
+    Args:
+      count: the number of words.
+      seed: the random seed.
+      model: the model to sample from; defaults to `default_model()`.
+
+    Yields:
+      The words.
+    """
+    if model is None:
+        model = default_model()
+    return model.sample(count, seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("count", type=int, help="number of words")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--train",
+        default=JPD_PATH,
+        help="training word list or TSV file, like jpd.tsv, whose first "
+        "column is read",
+    )
+    parser.add_argument("--order", type=int, default=2, help="n-gram order")
+    parser.add_argument(
+        "--smoothing",
+        type=float,
+        default=1.0,
+        help="pseudo-counts of the unigram distribution in each context",
+    )
+    parser.add_argument(
+        "--lengths",
+        type=parse_lengths,
+        help="word length distribution in morae, as length:weight pairs, "
+        "e.g. 2:1,3:4,4:4,5:2; defaults to that of the training corpus",
+    )
+    parser.add_argument("--output", help="write the words here, not stdout")
+    args = parser.parse_args()
+    model = MoraModel(
+        lexicon.read_words(args.train),
+        args.order,
+        args.smoothing,
+        args.lengths,
+    )
+    sink = (
+        open(args.output, "w", encoding="utf8") if args.output else sys.stdout
+    )
+    try:
+        for word in model.sample(args.count, args.seed):
+            sink.write(f"{word}\n")
+    finally:
+        if args.output:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
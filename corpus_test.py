@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Unit tests for synthetic corpus generation."""
+
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import corpus
+import g2p
+
+TRAINING = ["きょう", "がっこう", "こんにち", "さっき", "ちょっきん"]
+
+
+class MoraeTest(unittest.TestCase):
+    def test_morae(self) -> None:
+        self.assertEqual(
+            corpus.morae("ちょっきん"), ["ちょ", "っ", "き", "ん"]
+        )
+        self.assertIn("きゃ", corpus.MORAE)
+        self.assertNotIn("ゃ", corpus.MORAE)
+
+
+class GenerateTest(unittest.TestCase):
+    def test_reproducible(self) -> None:
+        self.assertEqual(
+            list(corpus.generate(500, seed=1)),
+            list(corpus.generate(500, seed=1)),
+        )
+        self.assertNotEqual(
+            list(corpus.generate(500, seed=1)),
+            list(corpus.generate(500, seed=2)),
+        )
+
+    def test_well_formed(self) -> None:
+        for order in (1, 2, 3):
+            model = corpus.MoraModel(TRAINING, order=order, smoothing=5.0)
+            for word in model.sample(5000, seed=order):
+                self.assertEqual(g2p.normalize(word), word)
+
+    def test_lengths(self) -> None:
+        model = corpus.MoraModel(TRAINING, lengths={2: 1.0, 6: 3.0})
+        lengths = collections.Counter(
+            len(corpus.morae(word)) for word in model.sample(4000)
+        )
+        self.assertEqual(set(lengths), {2, 6})
+        self.assertGreater(lengths[6], 2 * lengths[2])
+
+    def test_training_statistics(self) -> None:
+        model = corpus.MoraModel(["かか"] * 100, smoothing=0.01)
+        words = list(model.sample(1000))
+        self.assertGreater(words.count("かか"), 900)
+
+    def test_parse_lengths(self) -> None:
+        self.assertEqual(corpus.parse_lengths("2:1,3:4"), {2: 1.0, 3: 4.0})
+        for spec in ("0:1", "2:0", "2"):
+            with self.assertRaises(ValueError):
+                corpus.parse_lengths(spec)
+
+
+class MainTest(unittest.TestCase):
+    def test_word_list(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "words.txt")
+            with open(path, "w", encoding="utf8") as sink:
+                sink.write("".join(f"{word}\n" for word in TRAINING))
+            process = subprocess.run(
+                [sys.executable, "corpus.py", "20", "--train", path],
+                capture_output=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                encoding="utf8",
+            )
+        words = process.stdout.split()
+        self.assertEqual(len(words), 20)
+        self.assertLessEqual(
+            {len(corpus.morae(word)) for word in words}, {2, 3, 4}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,331 @@
+"""Table-driven runtime for the compiled Hiragana G2P grammar.
+
+An `Engine` is a sequential transducer stored as flat arrays: for each state
+and input character, the next state and the output emitted, plus an output
+for each final state. Transcription walks these arrays one character at a
+time, so this module has no dependency on Pynini or OpenFst; see
+`g2p.compile_engine` for how an engine is built from the grammar.
+"""
+
+import mmap
+import struct
+from array import array
+from typing import FrozenSet, List, Sequence, Set, Tuple
+
+_MAGIC = b"G2PE"
+_VERSION = 2
+_HEADER = struct.Struct("<4sI64siiii")
+
+# A pair of runs of the transducer: each state, and the output it has yet to
+# emit beyond what the two have in common.
+_Run = Tuple[int, int, bytes, bytes]
+
+# The most output two runs may differ by before `safe_cuts` gives up on them.
+_MAX_PENDING = 64
+
+
+class Error(Exception):
+    """Errors specific to this module."""
+
+    pass
+
+
+class Engine:
+    """A sequential transducer over characters.
+
+    Args:
+      alphabet: the input characters; a character's index is its symbol.
+      start: the start state.
+      transitions: the next state for each (state, symbol) pair, in row-major
+        order, or -1 if there is none.
+      outputs: the index in `strings` of the output for each (state, symbol)
+        pair.
+      finals: the index in `strings` of the final output for each state, or
+        -1 if the state is not final.
+      strings: the UTF-8 output strings.
+      key: an identifier for the grammar the engine was compiled from.
+    """
+
+    def __init__(
+        self,
+        alphabet: str,
+        start: int,
+        transitions: Sequence[int],
+        outputs: Sequence[int],
+        finals: Sequence[int],
+        strings: List[bytes],
+        key: str = "",
+    ):
+        self.alphabet = alphabet
+        self.start = start
+        self.transitions = transitions
+        self.outputs = outputs
+        self.finals = finals
+        self.strings = strings
+        self.key = key
+        self._index = {char: i for i, char in enumerate(alphabet)}
+
+    @property
+    def num_states(self) -> int:
+        return len(self.finals)
+
+    @property
+    def width(self) -> int:
+        return len(self.alphabet)
+
+    def transcribe(self, istring: str) -> str:
+        """Applies the transducer.
+
+        Args:
+          istring: the graphemic input string.
+
+        Returns:
+          The phonemic output string.
+
+        Raises:
+          Error: the input is not accepted.
+        """
+        index = self._index
+        width = len(self.alphabet)
+        transitions = self.transitions
+        outputs = self.outputs
+        strings = self.strings
+        state = self.start
+        pieces = []
+        for char in istring:
+            symbol = index.get(char)
+            if symbol is None:
+                raise Error(f"Unknown character: {char!r}")
+            arc = state * width + symbol
+            state = transitions[arc]
+            if state < 0:
+                raise Error(f"Transcription failure: {istring!r}")
+            pieces.append(strings[outputs[arc]])
+        final = self.finals[state]
+        if final < 0:
+            raise Error(f"Transcription failure: {istring!r}")
+        pieces.append(strings[final])
+        return b"".join(pieces).decode("utf8")
+
+    def safe_cuts(self) -> FrozenSet[str]:
+        """Finds where input can be split without changing the output.
+
+        A cut between two adjacent characters is safe if, for any input
+        containing them, transcribing the text before and after the cut
+        separately and concatenating the outputs gives the same result, or
+        failure, as transcribing the whole: no rule context, including the
+        beginning and end of the input, spans the cut. This is checked for
+        every state the first character can lead to, by comparing what the
+        transducer does from there with what it does from the start state.
+
+        Returns:
+          The safe cuts, each as the two-character string around it.
+        """
+        width = self.width
+        incoming: List[Set[int]] = [set() for _ in range(self.num_states)]
+        for arc, state in enumerate(self.transitions):
+            if state >= 0:
+                incoming[state].add(arc % width)
+        # Pairs of runs already shown to be equivalent.
+        equivalent: Set[_Run] = set()
+        cuts = set()
+        for first in range(width):
+            states = [
+                state
+                for state in range(self.num_states)
+                if first in incoming[state]
+            ]
+            for second in range(width):
+                if states and all(
+                    self._is_safe_cut(state, second, equivalent)
+                    for state in states
+                ):
+                    cuts.add(self.alphabet[first] + self.alphabet[second])
+        return frozenset(cuts)
+
+    def _is_safe_cut(
+        self, state: int, symbol: int, equivalent: Set["_Run"]
+    ) -> bool:
+        final = self.finals[state]
+        if final < 0:
+            return False
+        arc = state * self.width + symbol
+        start_arc = self.start * self.width + symbol
+        return self._equivalent(
+            self.transitions[arc],
+            self.strings[self.outputs[arc]],
+            self.transitions[start_arc],
+            self.strings[final] + self.strings[self.outputs[start_arc]],
+            equivalent,
+        )
+
+    def _equivalent(
+        self,
+        state: int,
+        pending: bytes,
+        other: int,
+        other_pending: bytes,
+        equivalent: Set["_Run"],
+    ) -> bool:
+        """Checks whether two states, each with output yet to be emitted,
+        produce the same output for every continuation.
+
+        If so, every pair of runs visited is added to `equivalent`.
+        """
+        width = self.width
+        seen: Set[_Run] = set()
+        stack = [(state, pending, other, other_pending)]
+        while stack:
+            state, pending, other, other_pending = stack.pop()
+            if (state < 0) != (other < 0):
+                return False
+            if state < 0:
+                continue
+            common = _common_prefix(pending, other_pending)
+            pending = pending[common:]
+            other_pending = other_pending[common:]
+            if (pending and other_pending) or len(pending) + len(
+                other_pending
+            ) > _MAX_PENDING:
+                return False
+            key = (state, other, pending, other_pending)
+            if key in seen or key in equivalent:
+                continue
+            seen.add(key)
+            final = self.finals[state]
+            other_final = self.finals[other]
+            if (final < 0) != (other_final < 0):
+                return False
+            if final >= 0 and (
+                pending + self.strings[final]
+                != other_pending + self.strings[other_final]
+            ):
+                return False
+            for symbol in range(width):
+                arc = state * width + symbol
+                other_arc = other * width + symbol
+                stack.append(
+                    (
+                        self.transitions[arc],
+                        pending + self.strings[self.outputs[arc]],
+                        self.transitions[other_arc],
+                        other_pending + self.strings[self.outputs[other_arc]],
+                    )
+                )
+        equivalent.update(seen)
+        return True
+
+    def save(self, path: str) -> None:
+        """Writes the engine to a binary file.
+
+        The tables are written in native byte order, aligned so that they can
+        be used in place when the file is memory-mapped; see `load`.
+
+        Args:
+          path: the output path.
+        """
+        offsets = array("i", [0])
+        for string in self.strings:
+            offsets.append(offsets[-1] + len(string))
+        alphabet = self.alphabet.encode("utf8")
+        with open(path, "wb") as sink:
+            sink.write(
+                _HEADER.pack(
+                    _MAGIC,
+                    _VERSION,
+                    self.key.encode("ascii"),
+                    self.start,
+                    self.num_states,
+                    len(alphabet),
+                    len(self.strings),
+                )
+            )
+            sink.write(alphabet)
+            sink.write(b"\0" * _padding(_HEADER.size + len(alphabet)))
+            for values in (self.transitions, self.outputs, self.finals):
+                sink.write(_int_array(values).tobytes())
+            sink.write(offsets.tobytes())
+            sink.write(b"".join(self.strings))
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = False) -> "Engine":
+        """Reads an engine written by `save`.
+
+        Args:
+          path: the input path.
+          use_mmap: if true, the file is memory-mapped read-only and the
+            tables are used in place rather than copied, so that processes
+            loading the same file share its pages.
+
+        Returns:
+          The engine.
+
+        Raises:
+          Error: the file is not a compatible engine.
+        """
+        with open(path, "rb") as source:
+            if use_mmap:
+                data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = source.read()
+        if len(data) < _HEADER.size:
+            raise Error(f"Not an engine file: {path}")
+        (
+            magic,
+            version,
+            key,
+            start,
+            num_states,
+            alphabet_size,
+            num_strings,
+        ) = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise Error(f"Not an engine file: {path}")
+        view = memoryview(data)
+        position = _HEADER.size
+        alphabet = bytes(view[position : position + alphabet_size])
+        position += alphabet_size
+        position += _padding(position)
+        width = len(alphabet.decode("utf8"))
+        tables = []
+        for size in (
+            num_states * width,
+            num_states * width,
+            num_states,
+            num_strings + 1,
+        ):
+            tables.append(view[position : position + 4 * size].cast("i"))
+            position += 4 * size
+        transitions, outputs, finals, offsets = tables
+        strings = [
+            bytes(view[position + offsets[i] : position + offsets[i + 1]])
+            for i in range(num_strings)
+        ]
+        return cls(
+            alphabet.decode("utf8"),
+            start,
+            transitions,
+            outputs,
+            finals,
+            strings,
+            key.rstrip(b"\0").decode("ascii"),
+        )
+
+
+def _common_prefix(first: bytes, second: bytes) -> int:
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+def _padding(size: int) -> int:
+    return -size % 4
+
+
+def _int_array(values: Sequence[int]) -> array:
+    if isinstance(values, array) and values.typecode == "i":
+        return values
+    return array("i", values)
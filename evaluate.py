@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""Evaluation of Hiragana G2P against a gold TSV file.
+
+The first column of the gold file (by default, `jpd.tsv`) is transcribed and
+compared with the second. Word error rate is the fraction of words transcribed
+incorrectly; phone error rate is the edit distance between the phonemes of the
+transcriptions and the gold transcriptions, as segmented by `g2p.segment`,
+over the number of gold phonemes. Words which cannot be transcribed count as
+empty transcriptions.
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import bulk
+import g2p
+import lexicon
+
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
+BATCH_SIZE = 4096
+
+
+class WordError(NamedTuple):
+    """A word transcribed incorrectly."""
+
+    word: str
+    gold: str
+    hypothesis: Optional[str]
+    distance: int
+
+
+class Evaluation(NamedTuple):
+    """The results of an evaluation."""
+
+    words: int
+    word_errors: int
+    phones: int
+    phone_errors: int
+    errors: List[WordError]
+
+    @property
+    def wer(self) -> float:
+        return self.word_errors / self.words if self.words else 0.0
+
+    @property
+    def per(self) -> float:
+        return self.phone_errors / self.phones if self.phones else 0.0
+
+
+def edit_distance(hypothesis: Sequence[str], reference: Sequence[str]) -> int:
+    """Computes the Levenshtein distance between two sequences.
+
+    Args:
+      hypothesis: the first sequence.
+      reference: the second sequence.
+
+    Returns:
+      The edit distance.
+    """
+    previous = list(range(len(reference) + 1))
+    for i, symbol in enumerate(hypothesis, 1):
+        current = [i]
+        for j, other in enumerate(reference, 1):
+            current.append(
+                min(
+                    previous[j - 1] + (symbol != other),
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def edit_distances(
+    pairs: Sequence[Tuple[Sequence[str], Sequence[str]]],
+) -> List[int]:
+    """Computes the Levenshtein distances between many pairs of sequences.
+
+    If NumPy is available, pairs are processed in batches, with each cell of
+    the dynamic program computed for a whole batch at once; pairs are sorted
+    by length first so that little padding is needed.
+
+    Args:
+      pairs: the (hypothesis, reference) pairs.
+
+    Returns:
+      The edit distance for each pair, in order.
+    """
+    if numpy is None:
+        return [edit_distance(*pair) for pair in pairs]
+    ids: Dict[str, int] = {}
+    encoded = [
+        tuple(
+            [ids.setdefault(symbol, len(ids)) for symbol in sequence]
+            for sequence in pair
+        )
+        for pair in pairs
+    ]
+    order = sorted(
+        range(len(encoded)),
+        key=lambda i: (len(encoded[i][0]), len(encoded[i][1])),
+    )
+    distances = [0] * len(encoded)
+    for start in range(0, len(order), BATCH_SIZE):
+        batch = order[start : start + BATCH_SIZE]
+        results = _batch_edit_distances([encoded[i] for i in batch])
+        for i, distance in zip(batch, results):
+            distances[i] = int(distance)
+    return distances
+
+
+def _batch_edit_distances(
+    pairs: Sequence[Tuple[List[int], List[int]]],
+) -> "numpy.ndarray":
+    size = len(pairs)
+    hypothesis_lengths = numpy.array([len(h) for h, _ in pairs])
+    reference_lengths = numpy.array([len(r) for _, r in pairs])
+    width = int(hypothesis_lengths.max(initial=0))
+    height = int(reference_lengths.max(initial=0))
+    # Padding values differ, so padding never matches.
+    hypotheses = numpy.full((size, width), -1)
+    references = numpy.full((size, height), -2)
+    for i, (hypothesis, reference) in enumerate(pairs):
+        hypotheses[i, : len(hypothesis)] = hypothesis
+        references[i, : len(reference)] = reference
+    rows = numpy.arange(size)
+    results = reference_lengths.copy()
+    previous = numpy.tile(numpy.arange(height + 1), (size, 1))
+    for i in range(1, width + 1):
+        substitution = previous[:, :-1] + (
+            hypotheses[:, i - 1 : i] != references
+        )
+        best = numpy.minimum(substitution, previous[:, 1:] + 1)
+        current = numpy.empty_like(previous)
+        current[:, 0] = i
+        for j in range(1, height + 1):
+            current[:, j] = numpy.minimum(
+                best[:, j - 1], current[:, j - 1] + 1
+            )
+        done = hypothesis_lengths == i
+        results[done] = current[rows[done], reference_lengths[done]]
+        previous = current
+    return results
+
+
+def evaluate(
+    gold: Sequence[Tuple[str, str]], processes: Optional[int] = None
+) -> Evaluation:
+    """Transcribes and scores a gold set.
+
+    Args:
+      gold: the (word, transcription) pairs.
+      processes: if set, transcribe across this many worker processes.
+
+    Returns:
+      The evaluation.
+    """
+    words = [word for word, _ in gold]
+    if processes:
+        hypotheses = [
+            ostring for _, ostring in bulk.transcribe(words, processes)
+        ]
+    else:
+        hypotheses = [
+            None if isinstance(result, g2p.rewrite.Error) else result
+            for result in g2p.g2p_batch(words)
+        ]
+    references = [g2p.segment(ostring) for _, ostring in gold]
+    distances = edit_distances(
+        [
+            (g2p.segment(hypothesis or ""), reference)
+            for hypothesis, reference in zip(hypotheses, references)
+        ]
+    )
+    errors = [
+        WordError(word, ostring, hypothesis, distance)
+        for (word, ostring), hypothesis, distance in zip(
+            gold, hypotheses, distances
+        )
+        if hypothesis != ostring
+    ]
+    return Evaluation(
+        len(gold),
+        len(errors),
+        sum(len(reference) for reference in references),
+        sum(distances),
+        errors,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "gold", nargs="?", default=JPD_PATH, help="gold TSV file"
+    )
+    parser.add_argument(
+        "--processes", type=int, help="transcribe across worker processes"
+    )
+    parser.add_argument(
+        "--errors",
+        help="write the words in error to this TSV file, not stdout",
+    )
+    args = parser.parse_args()
+    evaluation = evaluate(
+        list(lexicon.read_entries(args.gold)), args.processes
+    )
+    sink = (
+        open(args.errors, "w", encoding="utf8") if args.errors else sys.stdout
+    )
+    try:
+        for error in evaluation.errors:
+            sink.write(
+                f"{error.word}\t{error.gold}\t{error.hypothesis or ''}\t"
+                f"{error.distance}\n"
+            )
+    finally:
+        if args.errors:
+            sink.close()
+    print(
+        f"WER: {evaluation.wer:.2%} "
+        f"({evaluation.word_errors}/{evaluation.words} words)",
+        file=sys.stderr,
+    )
+    print(
+        f"PER: {evaluation.per:.2%} "
+        f"({evaluation.phone_errors}/{evaluation.phones} phones)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""Unit tests for G2P evaluation."""
+
+import random
+import unittest
+
+import evaluate
+
+
+class EditDistanceTest(unittest.TestCase):
+    def test_edit_distance(self) -> None:
+        self.assertEqual(evaluate.edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(evaluate.edit_distance("", "abc"), 3)
+        self.assertEqual(evaluate.edit_distance(["i̥"], ["i"]), 1)
+
+    def test_edit_distances(self) -> None:
+        rng = random.Random(0)
+        pairs = [
+            (
+                [rng.choice("abc") for _ in range(rng.randint(0, 8))],
+                [rng.choice("abc") for _ in range(rng.randint(0, 8))],
+            )
+            for _ in range(500)
+        ]
+        self.assertEqual(
+            evaluate.edit_distances(pairs),
+            [evaluate.edit_distance(*pair) for pair in pairs],
+        )
+
+
+class EvaluateTest(unittest.TestCase):
+    def test_evaluate(self) -> None:
+        evaluation = evaluate.evaluate(
+            [("じか", "dʑikɑ"), ("ことし", "kotoɕi"), ("abc", "abc")]
+        )
+        self.assertEqual((evaluation.words, evaluation.word_errors), (3, 2))
+        # ɕi̥ for ɕi is one phone error; the failure deletes three phones.
+        self.assertEqual(evaluation.phone_errors, 4)
+        self.assertEqual(evaluation.phones, 14)
+        self.assertEqual(evaluation.errors[0].hypothesis, "kotoɕi̥")
+        self.assertIsNone(evaluation.errors[1].hypothesis)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,145 @@
 """Hiragana g2p rules."""
 
-from pynini import accep, union, cdrewrite, cross, string_map
+import argparse
+import fileinput
+import functools
+import hashlib
+import inspect
+import os
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from pynini import (
+    NO_STATE_ID,
+    Far,
+    Fst,
+    FstIOError,
+    FstLike,
+    SymbolTable,
+    Weight,
+    accep,
+    cdrewrite,
+    closure,
+    compose,
+    cross,
+    shortestpath,
+    string_map,
+    union,
+)
 from pynini.lib import rewrite
 
-monographs = union(
+import engine
+import lexicon
+
+# The grammar is compiled over a symbol table with one label per grapheme and
+# per phoneme, rather than over bytes. Strings are converted to and from
+# labels at the edges; see `_tokens` and `_string`.
+SYMBOLS = SymbolTable()
+SYMBOLS.add_symbol("<epsilon>")
+
+
+def _symbols(*symbols: str) -> Fst:
+    """Adds symbols to `SYMBOLS`, returning the union of their acceptors."""
+    for symbol in symbols:
+        SYMBOLS.add_symbol(symbol)
+    return union(*(accep(symbol, token_type=SYMBOLS) for symbol in symbols))
+
+
+def _tokens(string: str, add: bool = False) -> str:
+    """Splits a string into `SYMBOLS`, longest-first, separated by spaces.
+
+    If `add` is true, any other character is added to `SYMBOLS`. Rules use
+    this for characters outside the inventory, such as the "r" some long
+    vowel rules emit; since these are not in `SIGMA_STAR`, later stages
+    reject them, just as they did over bytes.
+
+    Raises:
+      ValueError: the string contains a character not in `SYMBOLS`, and
+        `add` is false.
+    """
+    tokens = []
+    position = 0
+    while position < len(string):
+        for length in range(_MAX_SYMBOL_LENGTH, 0, -1):
+            token = string[position : position + length]
+            if SYMBOLS.member(token):
+                break
+        else:
+            if not add:
+                raise ValueError(f"Unknown symbol in {string!r}")
+            length = 1
+            token = string[position]
+            SYMBOLS.add_symbol(token)
+        tokens.append(token)
+        position += length
+    return " ".join(tokens)
+
+
+def _string(fst: Fst) -> str:
+    """Returns the string of a single-path FST's output labels."""
+    return "".join(fst.string(token_type=SYMBOLS).split())
+
+
+def _strings(fst: Fst) -> List[str]:
+    """Returns the output strings of an acyclic FST."""
+    return [
+        "".join(ostring.split())
+        for ostring in fst.paths(output_token_type=SYMBOLS).ostrings()
+    ]
+
+
+def _accep(string: str) -> Fst:
+    return accep(_tokens(string, add=True), token_type=SYMBOLS)
+
+
+def cross_symbols(istring: FstLike, ostring: FstLike) -> Fst:
+    """Compiles a rewrite from one string to another over `SYMBOLS`.
+
+    This is how the rules of `STAGES` are written. Strings are split into
+    symbols longest-first, and any character not yet in `SYMBOLS` is added
+    to it.
+
+    Args:
+      istring: the input string, or an acceptor over `SYMBOLS`.
+      ostring: the output string, or an acceptor over `SYMBOLS`.
+
+    Returns:
+      The transducer.
+    """
+    return cross(
+        _accep(istring) if isinstance(istring, str) else istring,
+        _accep(ostring) if isinstance(ostring, str) else ostring,
+    )
+
+
+def _string_map(pairs: Iterable[Tuple[str, str]]) -> Fst:
+    return string_map(
+        [
+            (_tokens(istring, add=True), _tokens(ostring, add=True))
+            for istring, ostring in pairs
+        ],
+        input_token_type=SYMBOLS,
+        output_token_type=SYMBOLS,
+    )
+
+
+monographs = _symbols(
     "あ",
     "い",
     "う",
@@ -76,13 +212,13 @@ monographs = union(
     "ん",
 )
 
-sokuon = accep("っ")
+sokuon = _symbols("っ")
 
-yoon = union("ゃ", "ゅ", "ょ")
+yoon = _symbols("ゃ", "ゅ", "ょ")
 
 graphemes = union(monographs, sokuon, yoon).optimize()
 
-voiced_consonants = union(
+voiced_consonants = _symbols(
     "b",
     "d",
     "ɡ",
@@ -104,22 +240,104 @@ voiced_consonants = union(
     "y",
 )
 
-voiceless_consonants = union("ç", "ɕ", "ɸ", "h", "k", "t", "s")
+voiceless_consonants = _symbols("ç", "ɕ", "ɸ", "h", "k", "t", "s")
 
-glottal_stop = accep("ʔ")
+glottal_stop = _symbols("ʔ")
 
 consonants = union(voiceless_consonants, voiced_consonants, glottal_stop)
 
-vowels = union(
+vowels = _symbols(
     "a", "ɑ", "ã", "i", "i̥", "ĩ", "ɯ", "ɯ̥", "ɯ̃", "e", "ẽ", "o", "õ"
 )
 
-suprasegmentals = accep("ː")
+suprasegmentals = _symbols("ː")
 
 phonemes = union(consonants, vowels, suprasegmentals)
 
 SIGMA_STAR = union(graphemes, phonemes).closure().optimize()
 
+_MAX_SYMBOL_LENGTH = max(
+    len(SYMBOLS.find(label)) for label in range(1, SYMBOLS.num_symbols())
+)
+
+
+# The phoneme inventory, as strings, in a stable order.
+PHONEME_INVENTORY = sorted(set(_strings(phonemes)))
+
+_PHONEME_SET = frozenset(PHONEME_INVENTORY)
+
+# The ID of each phoneme: its index in `PHONEME_INVENTORY`.
+PHONEME_IDS = {phoneme: i for i, phoneme in enumerate(PHONEME_INVENTORY)}
+
+# The `array` type code of phoneme ID buffers, unsigned 16-bit.
+ID_TYPECODE = "H"
+
+_MAX_PHONEME_LENGTH = max(len(phoneme) for phoneme in PHONEME_INVENTORY)
+
+
+def segment(ostring: str) -> List[str]:
+    """Splits a phonemic string into phonemes.
+
+    Phonemes are matched longest-first against `PHONEME_INVENTORY`, and any
+    other character is taken on its own; either way, any combining marks
+    which follow are kept with it.
+
+    Args:
+      ostring: the phonemic string.
+
+    Returns:
+      The phonemes.
+    """
+    phones = []
+    position = 0
+    while position < len(ostring):
+        for length in range(_MAX_PHONEME_LENGTH, 1, -1):
+            if ostring[position : position + length] in _PHONEME_SET:
+                break
+        else:
+            length = 1
+        while position + length < len(ostring) and unicodedata.combining(
+            ostring[position + length]
+        ):
+            length += 1
+        phones.append(ostring[position : position + length])
+        position += length
+    return phones
+
+
+class PhonemeError(rewrite.Error, ValueError):
+    """A phonemic string, such as an exception lexicon entry or an output
+    with a grapheme passed through, contains a phoneme not in
+    `PHONEME_INVENTORY`."""
+
+    pass
+
+
+def phoneme_ids(ostring: str) -> array:
+    """Converts a phonemic string to phoneme IDs.
+
+    Args:
+      ostring: the phonemic string.
+
+    Returns:
+      The `PHONEME_IDS` of its phonemes, matched longest-first.
+
+    Raises:
+      PhonemeError: the string contains a phoneme not in `PHONEME_INVENTORY`.
+    """
+    ids = array(ID_TYPECODE)
+    position = 0
+    while position < len(ostring):
+        for length in range(_MAX_PHONEME_LENGTH, 0, -1):
+            phoneme_id = PHONEME_IDS.get(ostring[position : position + length])
+            if phoneme_id is not None:
+                break
+        else:
+            raise PhonemeError(f"Unknown phoneme in {ostring!r}")
+        ids.append(phoneme_id)
+        position += length
+    return ids
+
 
 digraph_bos_map = [
     ("じゃ", "dʑɑ"),
@@ -313,37 +531,858 @@ monograph_bos_map = [
     ("ぞ", "dzo"),
 ]
 
-G2P = (
-    cdrewrite(cross("は", "ɰɑ"), "[BOS]", "[EOS]", SIGMA_STAR)
-    @ cdrewrite(string_map(digraph_bos_map), "[BOS]", "", SIGMA_STAR)
-    @ cdrewrite(string_map(digraph_map), "", "", SIGMA_STAR)
-    @ cdrewrite(string_map(monograph_bos_map), "[BOS]", "", SIGMA_STAR)
-    @ cdrewrite(cross("ん", "n"), "ː", "", SIGMA_STAR)
-    @ cdrewrite(cross("ん", "ɴ"), "", "", SIGMA_STAR)
-    @ cdrewrite(string_map(long_vowel_map), "", "", SIGMA_STAR)
-    @ cdrewrite(string_map(context_free_map), "", "", SIGMA_STAR)
-    @ cdrewrite(string_map(nasalization_map), "", "ɴ", SIGMA_STAR)
-    @ cdrewrite(
-        string_map(devoicing_map),
+# Input normalization; see `normalize`.
+
+POLICIES = ("raise", "skip", "repair")
+
+
+class InputError(rewrite.Error):
+    """Unsupported or malformed input."""
+
+    pass
+
+
+# The kana of `graphemes`, as strings, and the sokuon among them.
+GRAPHEME_SET = frozenset(_strings(graphemes))
+SOKUON = "っ"
+
+_LONG_VOWEL_MARK = "ー"
+
+# Katakana are read as the corresponding hiragana.
+_TRANSLATIONS = {
+    code: code - 0x60
+    for code in range(ord("ァ"), ord("ヶ") + 1)
+    if chr(code - 0x60) in GRAPHEME_SET
+}
+
+# The vowel of each kana, as a kana, for lengthening with ー.
+_VOWEL_KANA = {
+    "ɑ": "あ",
+    "a": "あ",
+    "i": "い",
+    "ɯ": "う",
+    "e": "え",
+    "o": "お",
+}
+_VOWELS = {
+    key[-1]: _VOWEL_KANA[value[-1]]
+    for key, value in context_free_map + digraph_map
+    if value[-1] in _VOWEL_KANA
+}
+
+# The small yōon kana, which may only follow a kana they form one of
+# `DIGRAPHS` with.
+YOON_SET = frozenset(_strings(yoon))
+DIGRAPHS = frozenset(
+    key for key, _ in digraph_bos_map + digraph_map if key[-1] in YOON_SET
+)
+_LARGE_YOON = {
+    char: unicodedata.lookup(unicodedata.name(char).replace("SMALL ", ""))
+    for char in YOON_SET
+}
+
+# The kana a sokuon may not precede, as none begins a mora with an onset:
+# the vowels, ん, っ itself and the small yōon. Nor may it end the input.
+UNGEMINABLE = (
+    frozenset(
+        [key for key, value in context_free_map if value in _VOWEL_KANA]
+        + ["ん", SOKUON]
+    )
+    | YOON_SET
+)
+
+
+def normalize(istring: str, policy: str = "raise") -> Optional[str]:
+    """Normalizes and validates graphemic input in a single pass.
+
+    Katakana, including half-width katakana, are mapped to hiragana, and the
+    long vowel mark ー is replaced by the vowel it lengthens. The input is
+    then checked for characters outside `graphemes`, and for malformed
+    sequences: a ー with no vowel before it, a small ゃ, ゅ or ょ which does
+    not complete a digraph, and a っ at the end of the input or before a mora
+    with no onset.
+
+    Args:
+      istring: the graphemic input string.
+      policy: what to do with invalid input: "raise" an `InputError`, "skip"
+        it by returning None, or "repair" it, by dropping unsupported
+        characters and misplaced ー and っ, and replacing misplaced small kana
+        with full-size ones.
+
+    Returns:
+      The normalized string, or None if it is skipped.
+
+    Raises:
+      InputError: the input is invalid, and the policy is "raise".
+      ValueError: unknown policy.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy!r}")
+    if any("\uff61" <= char <= "\uff9f" for char in istring):
+        istring = unicodedata.normalize("NFKC", istring)
+    chars: List[str] = []
+    for char in istring.translate(_TRANSLATIONS):
+        if char == _LONG_VOWEL_MARK:
+            vowel = _VOWELS.get(chars[-1]) if chars else None
+            if vowel is not None:
+                chars.append(vowel)
+                continue
+            problem = "long vowel mark without a vowel"
+        elif char not in GRAPHEME_SET:
+            problem = f"unsupported character {char!r}"
+        elif chars and chars[-1] == SOKUON and char in UNGEMINABLE:
+            problem = f"sokuon before {char!r}"
+        elif char in YOON_SET and (
+            not chars or chars[-1] + char not in DIGRAPHS
+        ):
+            problem = f"{char!r} without a preceding kana"
+        else:
+            chars.append(char)
+            continue
+        if policy == "raise":
+            raise InputError(f"Invalid input {istring!r}: {problem}")
+        if policy == "skip":
+            return None
+        if char in GRAPHEME_SET:
+            if chars and chars[-1] == SOKUON and char in UNGEMINABLE:
+                chars.pop()
+            if char in YOON_SET and (
+                not chars or chars[-1] + char not in DIGRAPHS
+            ):
+                char = _LARGE_YOON[char]
+            chars.append(char)
+    if chars and chars[-1] == SOKUON:
+        if policy == "raise":
+            raise InputError(f"Invalid input {istring!r}: sokuon at the end")
+        if policy == "skip":
+            return None
+        chars.pop()
+    return "".join(chars)
+
+
+# The rule cascade, in order: (name, rule, left context, right context).
+STAGES = [
+    ("wa", cross_symbols("は", "ɰɑ"), "[BOS]", "[EOS]"),
+    ("digraph_bos_map", _string_map(digraph_bos_map), "[BOS]", ""),
+    ("digraph_map", _string_map(digraph_map), "", ""),
+    ("monograph_bos_map", _string_map(monograph_bos_map), "[BOS]", ""),
+    (
+        "moraic_nasal_after_long_vowel",
+        cross_symbols("ん", "n"),
+        _accep("ː"),
+        "",
+    ),
+    ("moraic_nasal", cross_symbols("ん", "ɴ"), "", ""),
+    ("long_vowel_map", _string_map(long_vowel_map), "", ""),
+    ("context_free_map", _string_map(context_free_map), "", ""),
+    ("nasalization_map", _string_map(nasalization_map), "", _accep("ɴ")),
+    (
+        "devoicing_map",
+        _string_map(devoicing_map),
         union(voiceless_consonants),
         union(voiceless_consonants, "[EOS]"),
-        SIGMA_STAR,
-    )
-    @ cdrewrite(string_map(gemination_map), sokuon, "", SIGMA_STAR)
-    @ cdrewrite(cross(sokuon, ""), "", "", SIGMA_STAR)
-    @ cdrewrite(
-        cross("ɡ", "ŋ"), union(vowels, suprasegmentals), vowels, SIGMA_STAR
-    )
-    @ cdrewrite(cross("ɡ", "ŋ"), "ɴ", "", SIGMA_STAR)
-    @ cdrewrite(cross("ɯ", "ː"), union("o", "ɯ"), "", SIGMA_STAR)
-    @ cdrewrite(cross("ɑ", "a"), "ss", "", SIGMA_STAR)
-    @ cdrewrite(cross("ɑ", "ã"), "", "ɴ", SIGMA_STAR)
-).optimize()
+    ),
+    ("gemination_map", _string_map(gemination_map), sokuon, ""),
+    ("sokuon_deletion", cross_symbols(sokuon, ""), "", ""),
+    (
+        "velar_nasal",
+        cross_symbols("ɡ", "ŋ"),
+        union(vowels, suprasegmentals),
+        vowels,
+    ),
+    (
+        "velar_nasal_after_moraic_nasal",
+        cross_symbols("ɡ", "ŋ"),
+        _accep("ɴ"),
+        "",
+    ),
+    ("long_u", cross_symbols("ɯ", "ː"), union(_accep("o"), _accep("ɯ")), ""),
+    ("a_after_geminate_s", cross_symbols("ɑ", "a"), _accep("ss"), ""),
+    ("a_nasalization", cross_symbols("ɑ", "ã"), "", _accep("ɴ")),
+]
+
+# Compiled grammar artifact; see `save` and `load`.
+FAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "g2p.far")
+
+# Compiled table-driven engine; see `compiled_engine`.
+ENGINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "g2p.engine"
+)
+
+# Compiled stages and partial cascades, keyed by content hash; see `build`.
+# Entries for stages and cascades no longer in `STAGES` are pruned as the
+# cache is written; see `_prune_cached`.
+STAGE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".g2p_cache"
+)
+
+
+def _serialize(fst: FstLike) -> bytes:
+    """Serializes a rule or context for hashing."""
+    if isinstance(fst, str):
+        return fst.encode("utf8")
+    return fst.write_to_string()
+
+
+def _stage_hash(stage: Tuple[str, FstLike, FstLike, FstLike]) -> str:
+    """Computes a content hash of a stage's rule, contexts and alphabet."""
+    _, tau, left, right = stage
+    digest = hashlib.sha256(_serialize(SIGMA_STAR))
+    for part in (tau, left, right):
+        serialized = _serialize(part)
+        digest.update(len(serialized).to_bytes(8, "little"))
+        digest.update(serialized)
+    return digest.hexdigest()
+
+
+def _prefix_hashes() -> List[str]:
+    """Computes a content hash of each prefix of the cascade."""
+    hashes = []
+    digest = hashlib.sha256()
+    for stage in STAGES:
+        digest.update(_stage_hash(stage).encode("ascii"))
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+
+def rules_hash() -> str:
+    """Computes a content hash of the rule cascade.
+
+    The hash covers every stage's rule and contexts, as well as `SIGMA_STAR`,
+    so it changes whenever any of the rule tables does.
+
+    Returns:
+      The hex digest.
+    """
+    return _prefix_hashes()[-1]
+
+
+def _read_cached(cache_dir: Optional[str], key: str) -> Optional[Fst]:
+    if cache_dir is None:
+        return None
+    path = os.path.join(cache_dir, f"{key}.fst")
+    if not os.path.exists(path):
+        return None
+    try:
+        return Fst.read(path)
+    except FstIOError:
+        return None
+
+
+def _write_cached(cache_dir: Optional[str], key: str, fst: Fst) -> None:
+    if cache_dir is None:
+        return
+    path = os.path.join(cache_dir, f"{key}.fst")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fst.write(tmp_path)
+        os.replace(tmp_path, path)
+    except (OSError, FstIOError):
+        pass
+
+
+def _prune_cached(cache_dir: Optional[str]) -> None:
+    """Removes cached stages and prefixes which are not in `STAGES`.
+
+    Other files in the directory, including other processes' temporary
+    files, are left as they are.
+    """
+    if cache_dir is None:
+        return
+    keys = {f"stage-{_stage_hash(stage)}" for stage in STAGES}
+    for key in _prefix_hashes():
+        keys.update((f"prefix-{key}", f"prefix-staged-{key}"))
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        key, extension = os.path.splitext(name)
+        if extension == ".fst" and key not in keys:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def _compile_stage(
+    stage: Tuple[str, FstLike, FstLike, FstLike],
+    cache_dir: Optional[str] = None,
+) -> Fst:
+    """Compiles one stage, reading it from the cache if possible."""
+    key = f"stage-{_stage_hash(stage)}"
+    rule = _read_cached(cache_dir, key)
+    if rule is None:
+        _, tau, left, right = stage
+        rule = cdrewrite(tau, left, right, SIGMA_STAR)
+        _write_cached(cache_dir, key, rule)
+    return rule
+
+
+# Build profiles; see `build`.
+PROFILES = ("fast", "full", "staged")
+
+_profile = os.environ.get("G2P_PROFILE", "full")
+
+
+def build(
+    cache_dir: Optional[str] = None, profile: Optional[str] = None
+) -> Fst:
+    """Compiles the rule cascade into a single transducer.
+
+    The profile trades build time against composition speed:
+
+      "fast": the stages are composed with no determinization or
+        minimization, for quick rebuilds during development.
+      "full": the composed cascade is optimized, and its arcs sorted by input
+        label, the side matched when input is composed with it.
+      "staged": each stage, and the cascade after each composition, is
+        optimized, keeping intermediate results small; the result is then
+        arc-sorted as for "full".
+
+    All profiles produce the same output. The result carries `SYMBOLS` as its
+    symbol tables, so that saved archives can be read by other revisions of
+    this module.
+
+    If a cache directory is given, each compiled stage, and the composition
+    of each prefix of the cascade, is stored there under a hash of its
+    contents. A later build then resumes from the longest unchanged prefix,
+    compiling only stages which changed and redoing only the compositions
+    which follow them. Entries for stages and prefixes which are no longer
+    part of the cascade are removed.
+
+    Args:
+      cache_dir: the directory for cached stages and prefixes, or None.
+      profile: one of `PROFILES`; defaults to the current profile, which may
+        be set with `set_profile` or the `G2P_PROFILE` environment variable.
+
+    Returns:
+      The G2P FST.
+
+    Raises:
+      ValueError: unknown profile.
+    """
+    if profile is None:
+        profile = _profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile: {profile!r}")
+    staged = profile == "staged"
+    # Only the staged profile optimizes prefixes, so the others share them.
+    prefix = "prefix-staged" if staged else "prefix"
+    prefix_keys = [f"{prefix}-{key}" for key in _prefix_hashes()]
+    cascade = None
+    resume = 0
+    for i in range(len(STAGES) - 1, -1, -1):
+        cascade = _read_cached(cache_dir, prefix_keys[i])
+        if cascade is not None:
+            resume = i + 1
+            break
+    for i in range(resume, len(STAGES)):
+        rule = _compile_stage(STAGES[i], cache_dir)
+        if staged:
+            rule.optimize()
+        cascade = rule if cascade is None else cascade @ rule
+        if staged:
+            cascade.optimize()
+        _write_cached(cache_dir, prefix_keys[i], cascade)
+    _prune_cached(cache_dir)
+    cascade.set_input_symbols(SYMBOLS)
+    cascade.set_output_symbols(SYMBOLS)
+    if profile == "fast":
+        return cascade
+    if not staged:
+        cascade.optimize()
+    return cascade.arcsort("ilabel")
+
+
+class StageStats(NamedTuple):
+    """Build statistics for one stage of the cascade; see `build_stats`."""
+
+    name: str
+    compile_s: float
+    compose_s: float
+    states: int
+    arcs: int
+    optimized_states: int
+    optimized_arcs: int
+
+
+def _num_arcs(fst: Fst) -> int:
+    return sum(fst.num_arcs(state) for state in fst.states())
+
+
+def build_stats() -> List[StageStats]:
+    """Builds the cascade as `build` does, measuring each stage.
+
+    For each stage, this records the time taken to compile its rule and to
+    compose it with the cascade so far, and the size of the resulting
+    transducer, both as is and once optimized. Optimization is applied to a
+    copy, so it does not affect later stages.
+
+    Returns:
+      The statistics for each stage, in order.
+    """
+    stats = []
+    cascade = None
+    for name, tau, left, right in STAGES:
+        start = time.perf_counter()
+        rule = cdrewrite(tau, left, right, SIGMA_STAR)
+        compiled = time.perf_counter()
+        cascade = rule if cascade is None else cascade @ rule
+        composed = time.perf_counter()
+        optimized = cascade.copy().optimize()
+        stats.append(
+            StageStats(
+                name,
+                compiled - start,
+                composed - compiled,
+                cascade.num_states(),
+                _num_arcs(cascade),
+                optimized.num_states(),
+                _num_arcs(optimized),
+            )
+        )
+    return stats
+
+
+def save(
+    fst: Fst, path: str = FAR_PATH, profile: Optional[str] = None
+) -> None:
+    """Writes the compiled grammar to a FAR keyed by the rules hash.
+
+    The file is written to a temporary path and then renamed, so concurrent
+    readers never observe a partial archive.
+
+    Args:
+      fst: the compiled G2P FST.
+      path: the output FAR path.
+      profile: the profile it was built with; defaults to the current one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with Far(tmp_path, "w") as sink:
+        sink[_far_key(profile)] = fst
+    os.replace(tmp_path, path)
+
+
+def _far_key(profile: Optional[str]) -> str:
+    return f"{rules_hash()}-{_profile if profile is None else profile}"
+
+
+def load(path: str = FAR_PATH, profile: Optional[str] = None) -> Optional[Fst]:
+    """Reads the compiled grammar from a FAR, if it is up to date.
+
+    Args:
+      path: the input FAR path.
+      profile: the profile it must have been built with; defaults to the
+        current one.
+
+    Returns:
+      The G2P FST, or None if the archive is missing, unreadable, or was
+      compiled from different rules or with a different profile.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with Far(path, "r") as source:
+            if source.get_key() != _far_key(profile):
+                return None
+            return source.get_fst()
+    except FstIOError:
+        return None
+
+
+def _load_or_build() -> Fst:
+    """Loads the compiled grammar, rebuilding and saving it if stale."""
+    fst = load()
+    if fst is None:
+        fst = build(STAGE_CACHE_DIR)
+        try:
+            save(fst)
+        except (OSError, FstIOError):
+            pass
+    return fst
+
+
+class CacheInfo(NamedTuple):
+    """Statistics for the `g2p` memo cache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class _LRUCache:
+    """A thread-safe, bounded least-recently-used cache.
+
+    Each `clear` starts a new generation. Callers read `generation` before
+    computing a value and pass it to `put`, which drops the value if the
+    cache was cleared in the meantime, since it may have been computed from
+    stale state.
+    """
+
+    def __init__(self, maxsize: int):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._maxsize = maxsize
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, key: str, value: str, generation: int) -> None:
+        with self._lock:
+            if self._maxsize <= 0 or generation != self._generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = 0
+            self._generation += 1
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._entries),
+                self._maxsize,
+            )
+
+    def _evict(self) -> None:
+        while len(self._entries) > max(self._maxsize, 0):
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+CACHE_SIZE = 65536
+
+_cache = _LRUCache(CACHE_SIZE)
+
+
+def cache_info() -> CacheInfo:
+    """Returns hit, miss and eviction counts for the `g2p` memo cache."""
+    return _cache.info()
+
+
+def cache_clear() -> None:
+    """Empties the `g2p` memo cache and resets its counters."""
+    _cache.clear()
+
+
+def set_cache_size(maxsize: int) -> None:
+    """Bounds the `g2p` memo cache, evicting entries as needed.
+
+    Args:
+      maxsize: the maximum number of entries; zero disables caching.
+    """
+    _cache.resize(maxsize)
+
+
+MODES = ("composed", "cascade", "engine")
+
+_mode = os.environ.get("G2P_MODE", "composed")
+_grammar: Optional[Fst] = None
+_stages: Optional[List[Fst]] = None
+_engine: Optional[engine.Engine] = None
+_cuts: Optional[FrozenSet[str]] = None
+_grammar_lock = threading.Lock()
+
+
+def set_mode(mode: str) -> None:
+    """Selects how the grammar is applied.
+
+    In "composed" mode, the default, the stages are composed into a single
+    transducer. In "cascade" mode, each stage is kept as a separate transducer
+    and applied to the output of the previous one, so only the states an input
+    reaches are ever expanded; this avoids building and holding the full
+    composition, at some cost per call. In "engine" mode, the table-driven
+    engine from `compile_engine` is used, memory-mapped from `ENGINE_PATH` so
+    that processes on the same host share it; it only accepts hiragana input.
+    All modes produce the same output for hiragana input.
+
+    The mode may also be chosen with the `G2P_MODE` environment variable.
+
+    Args:
+      mode: one of `MODES`.
+
+    Raises:
+      ValueError: unknown mode.
+    """
+    global _mode, _grammar, _stages, _engine
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode!r}")
+    with _grammar_lock:
+        _mode = mode
+        _grammar = None
+        _stages = None
+        _engine = None
+        _cache.clear()
+
+
+def set_profile(profile: str) -> None:
+    """Selects the build profile of the composed grammar; see `build`.
+
+    The grammar is reloaded, or rebuilt, on next use.
+
+    Args:
+      profile: one of `PROFILES`.
+
+    Raises:
+      ValueError: unknown profile.
+    """
+    global _profile, _grammar
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile: {profile!r}")
+    with _grammar_lock:
+        _profile = profile
+        _grammar = None
+        _cache.clear()
+
+
+def stages() -> List[Fst]:
+    """Returns the compiled stages of the cascade, building them on first use.
+
+    Returns:
+      The rule FST for each of `STAGES`, in order.
+    """
+    global _stages
+    rules = _stages
+    if rules is None:
+        with _grammar_lock:
+            if _stages is None:
+                _cache.clear()
+                _stages = [
+                    _compile_stage(stage, STAGE_CACHE_DIR).optimize()
+                    for stage in STAGES
+                ]
+                _prune_cached(STAGE_CACHE_DIR)
+            rules = _stages
+    return rules
+
+
+def grammar() -> Fst:
+    """Returns the compiled grammar, loading or building it on first use.
+
+    This is safe to call from multiple threads; the grammar is only loaded or
+    built once.
+
+    Returns:
+      The G2P FST.
+    """
+    global _grammar
+    fst = _grammar
+    if fst is None:
+        with _grammar_lock:
+            if _grammar is None:
+                _cache.clear()
+                _grammar = _load_or_build()
+            fst = _grammar
+    return fst
+
+
+def rebuild() -> None:
+    """Reloads or rebuilds the grammar from the current `STAGES`.
+
+    Only what the current mode applies is rebuilt now: the composed grammar,
+    the compiled stages, or the engine; anything else is rebuilt on next use.
+    The `g2p` memo cache is cleared, since its entries may be stale.
+    """
+    global _grammar, _stages, _engine, _cuts
+    with _grammar_lock:
+        _grammar = None
+        _stages = None
+        _engine = None
+        _cuts = None
+        _cache.clear()
+    warmup()
+
+
+def _load_or_compile_engine() -> engine.Engine:
+    """Maps the compiled engine, recompiling and saving it if stale."""
+    key = rules_hash()
+    try:
+        compiled = engine.Engine.load(ENGINE_PATH, use_mmap=True)
+        if compiled.key == key:
+            return compiled
+    except (OSError, engine.Error):
+        pass
+    compiled = compile_engine(_load_or_build())
+    compiled.key = key
+    tmp_path = f"{ENGINE_PATH}.{os.getpid()}.tmp"
+    try:
+        compiled.save(tmp_path)
+        os.replace(tmp_path, ENGINE_PATH)
+        return engine.Engine.load(ENGINE_PATH, use_mmap=True)
+    except (OSError, engine.Error):
+        return compiled
+
+
+def compiled_engine() -> engine.Engine:
+    """Returns the table-driven engine used in "engine" mode.
+
+    On first use, the engine is memory-mapped from `ENGINE_PATH`, after being
+    compiled and saved there if it is missing or was compiled from different
+    rules.
+
+    Returns:
+      The engine.
+    """
+    global _engine
+    compiled = _engine
+    if compiled is None:
+        with _grammar_lock:
+            if _engine is None:
+                _cache.clear()
+                _engine = _load_or_compile_engine()
+            compiled = _engine
+    return compiled
+
+
+def warmup() -> None:
+    """Loads or builds the grammar ahead of the first `g2p` call."""
+    if _mode == "cascade":
+        stages()
+    elif _mode == "engine":
+        compiled_engine()
+    else:
+        grammar()
+
+
+def __getattr__(name: str):
+    # `G2P` is kept as a lazily-computed module attribute for compatibility.
+    if name == "G2P":
+        return grammar()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_input_policy = "raise"
+
+
+def set_input_policy(policy: str) -> None:
+    """Selects how `g2p` and `g2p_batch` handle invalid input.
+
+    Args:
+      policy: "raise" to raise `InputError`, or "repair"; see `normalize`.
+
+    Raises:
+      ValueError: unknown policy.
+    """
+    global _input_policy
+    if policy not in ("raise", "repair"):
+        raise ValueError(f"Unknown input policy: {policy!r}")
+    if policy != _input_policy:
+        _input_policy = policy
+        _cache.clear()
+
+
+def normalization_hash() -> str:
+    """Computes a content hash of how input is normalized.
+
+    The hash covers the code and tables of `normalize`, and the current input
+    policy: everything which decides what a grammar is given for an input.
+
+    Returns:
+      The hex digest.
+    """
+    digest = hashlib.sha256(inspect.getsource(normalize).encode("utf8"))
+    for part in (
+        _TRANSLATIONS,
+        _VOWELS,
+        _LARGE_YOON,
+        sorted(GRAPHEME_SET),
+        sorted(DIGRAPHS),
+        sorted(UNGEMINABLE),
+        _input_policy,
+    ):
+        digest.update(repr(part).encode("utf8"))
+    return digest.hexdigest()
+
+
+# The exception lexicon; see `set_lexicon`.
+_lexicon: Optional[Union[lexicon.Lexicon, lexicon.SortedLexicon]] = None
+
+
+def set_lexicon(
+    exceptions: Optional[Union[lexicon.Lexicon, lexicon.SortedLexicon]],
+) -> None:
+    """Sets the exception lexicon, which takes precedence over the rules.
+
+    The grammar is unaffected, so a lexicon may be replaced at any time
+    without rebuilding it. The `g2p` memo cache is cleared, since it also
+    holds the entries found for normalized inputs.
+
+    Args:
+      exceptions: the lexicon, or None for none.
+    """
+    global _lexicon
+    _lexicon = exceptions
+    _cache.clear()
+
+
+def load_lexicon(path: str, use_mmap: bool = False) -> None:
+    """Loads and sets the exception lexicon from a TSV file.
+
+    Args:
+      path: the TSV path, in the format of `jpd.tsv`.
+      use_mmap: if true, the file must be sorted by word, and is
+        memory-mapped rather than read; see `lexicon.SortedLexicon`.
+    """
+    set_lexicon(lexicon.load(path, use_mmap))
+
+
+def _lookup_normalized(
+    exceptions: Optional[Union[lexicon.Lexicon, lexicon.SortedLexicon]],
+    istring: str,
+    normalized: str,
+) -> Optional[str]:
+    """Looks up the normalized form of an input in the lexicon.
+
+    Callers look up the input itself first, before normalizing it, so the
+    normalized form is only looked up if it differs.
+    """
+    if exceptions is None or normalized == istring:
+        return None
+    return exceptions.get(normalized)
 
 
 def g2p(istring: str) -> str:
     """Applies the G2P rule.
 
+    The exception lexicon, if any, is consulted first. Otherwise, results are
+    memoized in a bounded LRU cache; see `cache_info` and `set_cache_size`.
+
+    This is safe to call from multiple threads, including while the grammar
+    is first loaded, or the mode or lexicon changed: the grammar and the
+    compiled stages and engine are only read once built, and the cache is
+    locked.
+
     Args:
       istring: the graphemic input string.
 
@@ -351,6 +1390,494 @@ def g2p(istring: str) -> str:
       The phonemic output string.
 
     Raises.
+      InputError: invalid input; see `set_input_policy`.
       rewrite.Error: composition failure.
     """
-    return rewrite.one_top_rewrite(istring, G2P)
+    exceptions = _lexicon
+    if exceptions is not None:
+        ostring = exceptions.get(istring)
+        if ostring is not None:
+            return ostring
+    return _rewrite(istring, exceptions)
+
+
+def _rewrite(
+    istring: str,
+    exceptions: Optional[Union[lexicon.Lexicon, lexicon.SortedLexicon]] = None,
+) -> str:
+    """Applies the G2P rule, memoized.
+
+    The input is normalized once, on a cache miss; if an exception lexicon is
+    given, its normalized form is looked up there before the rules apply.
+    """
+    generation = _cache.generation
+    ostring = _cache.get(istring)
+    if ostring is None:
+        normalized = normalize(istring, _input_policy)
+        ostring = _lookup_normalized(exceptions, istring, normalized)
+        if ostring is None:
+            ostring = _apply(normalized)
+        _cache.put(istring, ostring, generation)
+    return ostring
+
+
+def _apply(istring: str) -> str:
+    """Applies the grammar in the current mode to normalized input."""
+    if _mode == "cascade":
+        return _apply_stages(istring)
+    if _mode == "engine":
+        return _apply_engine(istring)
+    return "".join(
+        rewrite.one_top_rewrite(
+            _compile(istring), grammar(), output_token_type=SYMBOLS
+        ).split()
+    )
+
+
+def _top_rewrite(istring: str, fst: Fst) -> str:
+    """Applies a functional rule via a single shortest path.
+
+    This skips the determinization that `rewrite.one_top_rewrite` uses to
+    detect ties, which cannot arise as the cascade is a function.
+    """
+    return _string(_shortest(_compile(istring), fst))
+
+
+def compile_input(istring: str) -> Fst:
+    """Normalizes an input, as `g2p` does, and compiles it over `SYMBOLS`.
+
+    Args:
+      istring: the graphemic input string.
+
+    Returns:
+      The acceptor, ready to compose with the grammar or its stages.
+
+    Raises:
+      InputError: invalid input; see `set_input_policy`.
+      rewrite.Error: the normalized input has a symbol not in `SYMBOLS`.
+    """
+    return _compile(normalize(istring, _input_policy))
+
+
+def _compile(istring: str) -> Fst:
+    """Compiles an input string over `SYMBOLS`."""
+    try:
+        return accep(_tokens(istring), token_type=SYMBOLS)
+    except ValueError as error:
+        raise rewrite.Error(str(error)) from error
+
+
+def _shortest(lattice: Fst, fst: Fst) -> Fst:
+    """Returns the shortest path through the composition of two FSTs."""
+    lattice = compose(lattice, fst)
+    if lattice.start() == NO_STATE_ID:
+        raise rewrite.Error("Composition failure")
+    return shortestpath(lattice)
+
+
+def _apply_engine(istring: str) -> str:
+    """Applies the compiled engine, raising `rewrite.Error` on failure."""
+    try:
+        return compiled_engine().transcribe(istring)
+    except engine.Error as error:
+        raise rewrite.Error(str(error)) from error
+
+
+def _apply_stages(istring: str) -> str:
+    """Applies the cascade one stage at a time."""
+    lattice = _compile(istring)
+    for rule in stages():
+        lattice = _shortest(lattice, rule).project("output")
+    return _string(lattice)
+
+
+def g2p_batch(
+    istrings: Iterable[str], threads: int = 1
+) -> List[Union[str, rewrite.Error]]:
+    """Applies the G2P rule to many strings.
+
+    Each distinct input is only transcribed once. Inputs are normalized, and
+    looked up in the exception lexicon, as by `g2p`.
+
+    Args:
+      istrings: the graphemic input strings.
+      threads: if more than one, the distinct inputs are split evenly across
+        a pool of this many threads. Pynini holds the GIL throughout each
+        composition, so this only helps if other threads are blocked on I/O;
+        to use more than one core, see `bulk.transcribe`.
+
+    Returns:
+      A list of the phonemic output strings, in input order; inputs which
+      could not be transcribed are represented by the resulting
+      `rewrite.Error`.
+    """
+    if threads > 1:
+        istrings = list(istrings)
+        distinct = list(dict.fromkeys(istrings))
+        size = max(1, -(-len(distinct) // threads))
+        chunks = [
+            distinct[start : start + size]
+            for start in range(0, len(distinct), size)
+        ]
+        transcribed: Dict[str, Union[str, rewrite.Error]] = {}
+        with ThreadPoolExecutor(threads) as pool:
+            for chunk, results in zip(chunks, pool.map(g2p_batch, chunks)):
+                transcribed.update(zip(chunk, results))
+        return [transcribed[istring] for istring in istrings]
+    if _mode == "cascade":
+        transcribe = _apply_stages
+    elif _mode == "engine":
+        transcribe = _apply_engine
+    else:
+        transcribe = functools.partial(_top_rewrite, fst=grammar())
+    exceptions = _lexicon
+    memo: Dict[str, Union[str, rewrite.Error]] = {}
+    results = []
+    for istring in istrings:
+        result = memo.get(istring)
+        if result is None:
+            try:
+                if exceptions is not None:
+                    result = exceptions.get(istring)
+                if result is None:
+                    normalized = normalize(istring, _input_policy)
+                    result = _lookup_normalized(
+                        exceptions, istring, normalized
+                    )
+                    if result is None:
+                        result = transcribe(normalized)
+            except rewrite.Error as error:
+                result = error
+            memo[istring] = result
+        results.append(result)
+    return results
+
+
+def g2p_ids(istring: str) -> array:
+    """Applies the G2P rule, returning phoneme IDs.
+
+    The result supports the buffer protocol, so for example
+    `numpy.frombuffer(ids, dtype=numpy.uint16)` views it without copying.
+
+    Args:
+      istring: the graphemic input string.
+
+    Returns:
+      The `PHONEME_IDS` of the output, with type code `ID_TYPECODE`.
+
+    Raises:
+      InputError: invalid input; see `set_input_policy`.
+      PhonemeError: the output has a symbol not in `PHONEME_INVENTORY`,
+        either from the exception lexicon or a grapheme which no rule
+        rewrites, such as を, and which the grammar passes through.
+      rewrite.Error: composition failure.
+    """
+    return phoneme_ids(g2p(istring))
+
+
+class PhonemeIdBatch(NamedTuple):
+    """Phoneme IDs for a batch of inputs.
+
+    The IDs for input i are `ids[offsets[i] : offsets[i + 1]]`; inputs which
+    could not be transcribed have no IDs, and the resulting `rewrite.Error`
+    in `errors`.
+    """
+
+    ids: array
+    offsets: array
+    errors: Dict[int, rewrite.Error]
+
+
+def g2p_ids_batch(istrings: Iterable[str]) -> PhonemeIdBatch:
+    """Applies the G2P rule to many strings, returning phoneme IDs.
+
+    Args:
+      istrings: the graphemic input strings.
+
+    Returns:
+      The IDs of all outputs in one flat buffer, with type code
+      `ID_TYPECODE`, and the offset of each input's IDs in it. Outputs with
+      a symbol not in `PHONEME_INVENTORY`, as for `g2p_ids`, are recorded as
+      a `PhonemeError`.
+    """
+    ids = array(ID_TYPECODE)
+    offsets = array("q", [0])
+    errors: Dict[int, rewrite.Error] = {}
+    memo: Dict[str, Union[array, PhonemeError]] = {}
+    for i, result in enumerate(g2p_batch(istrings)):
+        if not isinstance(result, rewrite.Error):
+            output_ids = memo.get(result)
+            if output_ids is None:
+                try:
+                    output_ids = phoneme_ids(result)
+                except PhonemeError as error:
+                    output_ids = error
+                memo[result] = output_ids
+            result = output_ids
+        if isinstance(result, rewrite.Error):
+            errors[i] = result
+        else:
+            ids.extend(result)
+        offsets.append(len(ids))
+    return PhonemeIdBatch(ids, offsets, errors)
+
+
+# The shortest segment `g2p_text` splits off.
+SEGMENT_LENGTH = 16
+
+
+def safe_cuts() -> FrozenSet[str]:
+    """Returns where normalized input can be split without changing the output.
+
+    The cuts are derived from the compiled engine, and exclude cuts after a
+    sokuon or before a small kana, so that every segment is itself valid
+    input; see `engine.Engine.safe_cuts`.
+
+    Returns:
+      The safe cuts, each as the two-character string around it.
+    """
+    global _cuts
+    if _cuts is None:
+        cuts = _load_or_compile_engine().safe_cuts()
+        _cuts = frozenset(
+            cut for cut in cuts if cut[0] != SOKUON and cut[1] not in YOON_SET
+        )
+    return _cuts
+
+
+def g2p_text(text: str, segment_length: int = SEGMENT_LENGTH) -> str:
+    """Applies the G2P rule to long input, such as a sentence or document.
+
+    Unless the whole input is in the exception lexicon, the normalized input
+    is split at safe cuts, where no rule context spans the cut, into segments
+    of at least `segment_length` characters. Each segment is transcribed by
+    the rules, and memoized, as by `g2p`, and the outputs are concatenated;
+    the result is the same as transcribing the whole input.
+
+    Args:
+      text: the graphemic input string.
+      segment_length: the shortest segment split off.
+
+    Returns:
+      The phonemic output string.
+
+    Raises:
+      InputError: invalid input; see `set_input_policy`.
+      rewrite.Error: composition failure.
+    """
+    exceptions = _lexicon
+    if exceptions is not None:
+        ostring = exceptions.get(text)
+        if ostring is not None:
+            return ostring
+    normalized = normalize(text, _input_policy)
+    ostring = _lookup_normalized(exceptions, text, normalized)
+    if ostring is not None:
+        return ostring
+    text = normalized
+    cuts = safe_cuts()
+    ostrings = []
+    start = 0
+    for end in range(segment_length, len(text)):
+        if end - start >= segment_length and text[end - 1 : end + 1] in cuts:
+            ostrings.append(_rewrite(text[start:end]))
+            start = end
+    ostrings.append(_rewrite(text[start:]))
+    return "".join(ostrings)
+
+
+def apply_grammar(fst: Fst, istring: str) -> str:
+    """Applies a compiled grammar other than the current one.
+
+    The input is normalized as by `g2p`, but neither the exception lexicon
+    nor the memo cache is used.
+
+    Args:
+      fst: a G2P FST over `SYMBOLS`, as returned by `build` or `load`; or
+        one with no symbol tables at all, over bytes, as this module compiled
+        the grammar before `SYMBOLS` was introduced.
+      istring: the graphemic input string.
+
+    Returns:
+      The phonemic output string.
+
+    Raises:
+      InputError: invalid input; see `set_input_policy`.
+      rewrite.Error: composition failure.
+    """
+    normalized = normalize(istring, _input_policy)
+    if fst.input_symbols() is None and fst.output_symbols() is None:
+        return _shortest(accep(normalized), fst).string()
+    return _top_rewrite(normalized, fst)
+
+
+def compile_engine(fst: Optional[Fst] = None) -> engine.Engine:
+    """Compiles the grammar into a table-driven `engine.Engine`.
+
+    The grammar is restricted to hiragana input and determinized over
+    characters, delaying output until it is unambiguous. Since the rules only
+    look a bounded distance ahead, this terminates, yielding a sequential
+    transducer which emits any pending output at its final states.
+
+    Args:
+      fst: the G2P FST; defaults to the compiled grammar.
+
+    Returns:
+      The engine, which produces the same output as `g2p` on hiragana input.
+
+    Raises:
+      ValueError: the grammar is not functional.
+    """
+    if fst is None:
+        fst = grammar()
+    restricted = compose(closure(graphemes), fst).optimize()
+    zero = Weight.zero(restricted.weight_type())
+    arcs: Dict[int, Dict[int, List[Tuple[int, int]]]] = {}
+    epsilons: Dict[int, List[Tuple[int, int]]] = {}
+    for state in restricted.states():
+        for arc in restricted.arcs(state):
+            table = (
+                arcs.setdefault(state, {}).setdefault(arc.ilabel, [])
+                if arc.ilabel
+                else epsilons.setdefault(state, [])
+            )
+            table.append((arc.olabel, arc.nextstate))
+
+    # The UTF-8 output of each label.
+    symbol_bytes = [b""] + [
+        SYMBOLS.find(label).encode("utf8")
+        for label in range(1, SYMBOLS.num_symbols())
+    ]
+
+    # A subset is a set of (state, pending output) pairs.
+    Subset = FrozenSet[Tuple[int, bytes]]
+
+    def epsilon_closure(pairs: Iterable[Tuple[int, bytes]]) -> Set:
+        closed = set(pairs)
+        queue = list(closed)
+        while queue:
+            state, pending = queue.pop()
+            for label, nextstate in epsilons.get(state, ()):
+                pair = (nextstate, pending + symbol_bytes[label])
+                if pair not in closed:
+                    closed.add(pair)
+                    queue.append(pair)
+        return closed
+
+    def step(subset: Subset, char: str) -> Tuple[bytes, Optional[Subset]]:
+        pairs = epsilon_closure(
+            (nextstate, pending + symbol_bytes[label])
+            for state, pending in subset
+            for label, nextstate in arcs.get(state, {}).get(
+                SYMBOLS.find(char), ()
+            )
+        )
+        if not pairs:
+            return b"", None
+        prefix = os.path.commonprefix([pending for _, pending in pairs])
+        return prefix, frozenset(
+            (state, pending[len(prefix) :]) for state, pending in pairs
+        )
+
+    def finish(subset: Subset) -> Optional[bytes]:
+        endings = {
+            pending
+            for state, pending in subset
+            if restricted.final(state) != zero
+        }
+        if len(endings) > 1:
+            raise ValueError(f"Grammar is not functional: {endings!r}")
+        return endings.pop() if endings else None
+
+    alphabet = "".join(sorted(_strings(graphemes)))
+    start = frozenset(epsilon_closure([(restricted.start(), b"")]))
+    index = {start: 0}
+    queue = [start]
+    strings: Dict[bytes, int] = {}
+    transitions = array("i")
+    outputs = array("i")
+    finals = array("i")
+    for subset in queue:
+        for char in alphabet:
+            output, target = step(subset, char)
+            if target is None:
+                transitions.append(-1)
+                outputs.append(-1)
+                continue
+            if target not in index:
+                index[target] = len(queue)
+                queue.append(target)
+            transitions.append(index[target])
+            outputs.append(strings.setdefault(output, len(strings)))
+        final = finish(subset)
+        finals.append(
+            -1 if final is None else strings.setdefault(final, len(strings))
+        )
+    return engine.Engine(
+        alphabet, 0, transitions, outputs, finals, list(strings)
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Transcribes lines from files or stdin to `input<TAB>ipa` on stdout."""
+    parser = argparse.ArgumentParser(
+        prog="g2p", description="Hiragana grapheme-to-phoneme conversion."
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        default=["-"],
+        help="input files, one word per line; only the first column of TSV "
+        "lines is read (default: stdin)",
+    )
+    parser.add_argument(
+        "--errors",
+        choices=("raise", "skip", "report"),
+        default="raise",
+        help="on an untranscribable line: stop with an error, skip it, or "
+        "write it with an empty transcription and report it on stderr",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="repair invalid input rather than treating it as an error",
+    )
+    parser.add_argument(
+        "--lexicon",
+        help="exception lexicon TSV file, consulted before the rules",
+    )
+    parser.add_argument(
+        "--build",
+        action="store_true",
+        help=f"compile the grammar to {os.path.basename(FAR_PATH)} and exit",
+    )
+    args = parser.parse_args(argv)
+    if args.build:
+        save(build())
+        return 0
+    if args.repair:
+        set_input_policy("repair")
+    if args.lexicon:
+        load_lexicon(args.lexicon)
+    sink = sys.stdout
+    with fileinput.input(args.files, encoding="utf8") as source:
+        for line in source:
+            istring = line.rstrip("\r\n").split("\t", 1)[0]
+            try:
+                ostring = g2p(istring)
+            except rewrite.Error as error:
+                location = f"{fileinput.filename()}:{fileinput.filelineno()}"
+                if args.errors == "raise":
+                    print(f"{location}: {error}", file=sys.stderr)
+                    return 1
+                if args.errors == "skip":
+                    continue
+                print(f"{location}: {error}", file=sys.stderr)
+                ostring = ""
+            sink.write(f"{istring}\t{ostring}\n")
+    sink.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
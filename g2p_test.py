@@ -1,617 +1,648 @@
 #!/usr/bin/env python
 """Unit tests for Hiragana G2P."""
 
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
-import g2p
-
-
-class G2PTest(unittest.TestCase):
-    def rewrites(self, istring: str, expected_ostring: str) -> None:
-        """Asserts that the g2p rule produces the correct output.
-
-        Note that this itself is not a unit test because its name does not
-        begin with `test_`; but it can be used to implement other unit tests.
-
-        Args:
-            istring: the input string
-            expected_ostring: the expected output string.
-        """
-        ostring = g2p.g2p(istring)
-        self.assertEqual(ostring, expected_ostring)
-
-    def test_げんじてん(self) -> None:
-        self.rewrites("げんじてん", "ɡẽɴʑitẽɴ")
-
-    def test_じか(self) -> None:
-        self.rewrites("じか", "dʑikɑ")
-
-    def test_げんか(self) -> None:
-        self.rewrites("げんか", "ɡẽɴkɑ")
-
-    def test_とうせい(self) -> None:
-        self.rewrites("とうせい", "toːseː")
-
-    def test_とうせつ(self) -> None:
-        self.rewrites("とうせつ", "toːsetsɯ̥")
-
-    def test_きょうび(self) -> None:
-        self.rewrites("きょうび", "kjoːbi")
-
-    def test_とうだい(self) -> None:
-        self.rewrites("とうだい", "toːdɑi")
-
-    def test_げんせ(self) -> None:
-        self.rewrites("げんせ", "ɡẽɴse")
-
-    def test_げんせい(self) -> None:
-        self.rewrites("げんせい", "ɡẽɴseː")
-
-    def test_こんじょう(self) -> None:
-        self.rewrites("こんじょう", "kõɴʑoː")
-
-    def test_そっこん(self) -> None:
-        self.rewrites("そっこん", "sokkõɴ")
-
-    def test_きょうあす(self) -> None:
-        self.rewrites("きょうあす", "kjoːɑsɯ̥")
-
-    def test_ことし(self) -> None:
-        self.rewrites("ことし", "kotoɕi")
-
-    def test_こんねん(self) -> None:
-        self.rewrites("こんねん", "kõɴnẽɴ")
-
-    def test_こんじ(self) -> None:
-        self.rewrites("こんじ", "kõɴʑi")
-
-    def test_ほんねん(self) -> None:
-        self.rewrites("ほんねん", "hõɴnẽɴ")
-
-    def test_とうねん(self) -> None:
-        self.rewrites("とうねん", "toːnẽɴ")
-
-    def test_こんき(self) -> None:
-        self.rewrites("こんき", "kõɴki̥")
-
-    def test_こんしいずん(self) -> None:
-        self.rewrites("こんしいずん", "kõɴɕiːzɯ̃ɴ")
-
-    def test_こんしゅん(self) -> None:
-        self.rewrites("こんしゅん", "kõɴɕɯ̃ɴ")
-
-    def test_こんげつ(self) -> None:
-        self.rewrites("こんげつ", "kõɴŋetsɯ̥")
-
-    def test_ほんげつ(self) -> None:
-        self.rewrites("ほんげつ", "hõɴŋetsɯ̥")
-
-    def test_とうげつ(self) -> None:
-        self.rewrites("とうげつ", "toːŋetsɯ̥")
-
-    def test_こんしゅう(self) -> None:
-        self.rewrites("こんしゅう", "kõɴɕɯː")
-
-    def test_きょう(self) -> None:
-        self.rewrites("きょう", "kjoː")
-
-    def test_こんにち(self) -> None:
-        self.rewrites("こんにち", "kõɴnʲitɕi̥")
-
-    def test_ほんじつ(self) -> None:
-        self.rewrites("ほんじつ", "hõɴʑitsɯ̥")
-
-    def test_けさ(self) -> None:
-        self.rewrites("けさ", "kesɑ")
-
-    def test_こんぎょう(self) -> None:
-        self.rewrites("こんぎょう", "kõɴŋjoː")
-
-    def test_こんばん(self) -> None:
-        self.rewrites("こんばん", "kõmbãɴ")
-
-    def test_こんせき(self) -> None:
-        self.rewrites("こんせき", "kõɴseki̥")
-
-    def test_こんゆう(self) -> None:
-        self.rewrites("こんゆう", "kõɴyɯː")
-
-    def test_こよい(self) -> None:
-        self.rewrites("こよい", "koyoi")
-
-    def test_こんや(self) -> None:
-        self.rewrites("こんや", "kõɴyɑ")
-
-    def test_こんど(self) -> None:
-        self.rewrites("こんど", "kõɴdo")
-
-    def test_こんぱん(self) -> None:
-        self.rewrites("こんぱん", "kõɴpãɴ")
-
-    def test_こんかい(self) -> None:
-        self.rewrites("こんかい", "kõɴkɑi")
-
-    def test_こんじ(self) -> None:
-        self.rewrites("こんじ", "kõɴʑi")
-
-    def test_このたび(self) -> None:
-        self.rewrites("このたび", "konotɑbi")
-
-    def test_とうめん(self) -> None:
-        self.rewrites("とうめん", "toːmẽɴ")
-
-    def test_とうざ(self) -> None:
-        self.rewrites("とうざ", "toːzɑ")
-
-    def test_ここ(self) -> None:
-        self.rewrites("ここ", "koko")
-
-    def test_かこ(self) -> None:
-        self.rewrites("かこ", "kɑko")
-
-    def test_きおう(self) -> None:
-        self.rewrites("きおう", "kioː")
-
-    def test_むかし(self) -> None:
-        self.rewrites("むかし", "mɯkɑɕi")
-
-    def test_そのむかし(self) -> None:
-        self.rewrites("そのむかし", "sonomɯkɑɕi")
-
-    def test_むかしむかし(self) -> None:
-        self.rewrites("むかしむかし", "mɯkɑɕimɯkɑɕi")
-
-    def test_おおむかし(self) -> None:
-        self.rewrites("おおむかし", "oːmɯkɑɕi̥")
-
-    def test_ひとむかし(self) -> None:
-        self.rewrites("ひとむかし", "çi̥tomɯkɑɕi̥")
-
-    def test_せきねん(self) -> None:
-        self.rewrites("せきねん", "sekinẽɴ")
-
-    def test_せきじつ(self) -> None:
-        self.rewrites("せきじつ", "sekiʑitsɯ̥")
-
-    def test_せきじ(self) -> None:
-        self.rewrites("せきじ", "sekiʑi")
-
-    def test_おうせき(self) -> None:
-        self.rewrites("おうせき", "oːseki")
-
-    def test_そのかみ(self) -> None:
-        self.rewrites("そのかみ", "sonokɑmi")
-
-    def test_いにしえ(self) -> None:
-        self.rewrites("いにしえ", "inʲiɕie")
-
-    def test_おうこ(self) -> None:
-        self.rewrites("おうこ", "oːko")
-
-    def test_おうじ(self) -> None:
-        self.rewrites("おうじ", "oːʑi")
-
-    def test_こしかた(self) -> None:
-        self.rewrites("こしかた", "koɕi̥kɑtɑ")
-
-    def test_きしかた(self) -> None:
-        self.rewrites("きしかた", "ki̥ɕi̥kɑtɑ")
-
-    def test_おうねん(self) -> None:
-        self.rewrites("おうねん", "oːnẽɴ")
-
-    def test_とうねん(self) -> None:
-        self.rewrites("とうねん", "toːnẽɴ")
-
-    def test_せんねん(self) -> None:
-        self.rewrites("せんねん", "sẽɴnẽɴ")
-
-    def test_ひところ(self) -> None:
-        self.rewrites("ひところ", "çi̥tokoɾo")
-
-    def test_ひときり(self) -> None:
-        self.rewrites("ひときり", "çi̥tokiɾi")
-
-    def test_ぜんせ(self) -> None:
-        self.rewrites("ぜんせ", "zẽɴse")
-
-    def test_ぜんせい(self) -> None:
-        self.rewrites("ぜんせい", "zẽɴseː")
-
-    def test_しゅくせ(self) -> None:
-        self.rewrites("しゅくせ", "ɕɯ̥kɯse")
-
-    def test_すくせ(self) -> None:
-        self.rewrites("すくせ", "sɯ̥kɯse")
-
-    def test_ありしひ(self) -> None:
-        self.rewrites("ありしひ", "ɑɾiɕi̥çi")
-
-    def test_もと(self) -> None:
-        self.rewrites("もと", "moto")
-
-    def test_きゅう(self) -> None:
-        self.rewrites("きゅう", "kjɯː")
-
-    def test_せん(self) -> None:
-        self.rewrites("せん", "sẽɴ")
-
-    def test_いましがた(self) -> None:
-        self.rewrites("いましがた", "imɑɕiŋɑtɑ")
-
-    def test_せんこく(self) -> None:
-        self.rewrites("せんこく", "sẽɴkokɯ̥")
-
-    def test_さいぜん(self) -> None:
-        self.rewrites("さいぜん", "sɑizẽɴ")
-
-    def test_さき(self) -> None:
-        self.rewrites("さき", "sɑki")
-
-    def test_さっき(self) -> None:
-        self.rewrites("さっき", "sɑk̚ki̥")
-
-    def test_さきほど(self) -> None:
-        self.rewrites("さきほど", "sɑki̥hodo")
-
-    def test_このまえ(self) -> None:
-        self.rewrites("このまえ", "konomɑe")
-
-    def test_このあいだ(self) -> None:
-        self.rewrites("このあいだ", "konoɑidɑ")
-
-    def test_こないだ(self) -> None:
-        self.rewrites("こないだ", "konɑidɑ")
-
-    def test_せんだって(self) -> None:
-        self.rewrites("せんだって", "sẽɴdɑt̚te")
-
-    def test_せんじつ(self) -> None:
-        self.rewrites("せんじつ", "sẽɴʑitsɯ̥")
-
-    def test_かじつ(self) -> None:
-        self.rewrites("かじつ", "kɑʑitsɯ̥")
-
-    def test_きのうきょう(self) -> None:
-        self.rewrites("きのうきょう", "kinoːkjoː")
-
-    def test_さきごろ(self) -> None:
-        self.rewrites("さきごろ", "sɑkiŋoɾo")
-
-    def test_せんぱん(self) -> None:
-        self.rewrites("せんぱん", "sẽɴpãɴ")
-
-    def test_せんど(self) -> None:
-        self.rewrites("せんど", "sẽɴdo")
-
-    def test_かはん(self) -> None:
-        self.rewrites("かはん", "kɑhãɴ")
+from typing import List, Tuple
 
-    def test_いつぞや(self) -> None:
-        self.rewrites("いつぞや", "itsɯzoyɑ")
+import pynini
 
-    def test_さっこん(self) -> None:
-        self.rewrites("さっこん", "sɑkkõɴ")
-
-    def test_さいきん(self) -> None:
-        self.rewrites("さいきん", "sɑikĩɴ")
-
-    def test_ちょっきん(self) -> None:
-        self.rewrites("ちょっきん", "tɕok̚kĩɴ")
-
-    def test_ちかごろ(self) -> None:
-        self.rewrites("ちかごろ", "tɕi̥kɑŋoɾo")
-
-    def test_このほど(self) -> None:
-        self.rewrites("このほど", "konohodo")
-
-    def test_きんねん(self) -> None:
-        self.rewrites("きんねん", "kĩɴnẽɴ")
-
-    def test_きんらい(self) -> None:
-        self.rewrites("きんらい", "kĩɴɾɑi")
-
-    def test_きんじ(self) -> None:
-        self.rewrites("きんじ", "kĩɴʑi")
-
-    def test_きょねん(self) -> None:
-        self.rewrites("きょねん", "kjonẽɴ")
-
-    def test_さくねん(self) -> None:
-        self.rewrites("さくねん", "sɑkɯnẽɴ")
-
-    def test_かくねん(self) -> None:
-        self.rewrites("かくねん", "kɑkɯnẽɴ")
-
-    def test_きゅうねん(self) -> None:
-        self.rewrites("きゅうねん", "kjɯːnẽɴ")
-
-    def test_こぞ(self) -> None:
-        self.rewrites("こぞ", "kozo")
-
-    def test_おととし(self) -> None:
-        self.rewrites("おととし", "ototoɕi̥")
-
-    def test_いっさくねん(self) -> None:
-        self.rewrites("いっさくねん", "issakɯnẽɴ")
-
-    def test_さきおととし(self) -> None:
-        self.rewrites("さきおととし", "sɑkiototoɕi̥")
-
-    def test_いっさくさくねん(self) -> None:
-        self.rewrites("いっさくさくねん", "issakɯ̥sɑkɯnẽɴ")
-
-    def test_せんげつ(self) -> None:
-        self.rewrites("せんげつ", "sẽɴŋetsɯ̥")
-
-    def test_せんせんげつ(self) -> None:
-        self.rewrites("せんせんげつ", "sẽɴsẽɴŋetsɯ̥")
-
-    def test_きゅうろう(self) -> None:
-        self.rewrites("きゅうろう", "kjɯːɾoː")
-
-    def test_きゅうとう(self) -> None:
-        self.rewrites("きゅうとう", "kjɯːtoː")
-
-    def test_せんしゅう(self) -> None:
-        self.rewrites("せんしゅう", "sẽɴɕɯː")
-
-    def test_せんせんしゅう(self) -> None:
-        self.rewrites("せんせんしゅう", "sẽɴsẽɴɕɯː")
-
-    def test_きのう(self) -> None:
-        self.rewrites("きのう", "kinoː")
-
-    def test_さくじつ(self) -> None:
-        self.rewrites("さくじつ", "sɑkɯʑitsɯ̥")
-
-    def test_いえすたでえ(self) -> None:
-        self.rewrites("いえすたでえ", "iesɯ̥tɑdeː")
-
-    def test_きぞ(self) -> None:
-        self.rewrites("きぞ", "kizo")
-
-    def test_おととい(self) -> None:
-        self.rewrites("おととい", "ototoi")
-
-    def test_いっさくじつ(self) -> None:
-        self.rewrites("いっさくじつ", "issakɯʑitsɯ̥")
-
-    def test_さきおととい(self) -> None:
-        self.rewrites("さきおととい", "sɑkiototoi")
-
-    def test_せんせんじつ(self) -> None:
-        self.rewrites("せんせんじつ", "sẽɴsẽɴʑitsɯ̥")
-
-    def test_いっさくさくじつ(self) -> None:
-        self.rewrites("いっさくさくじつ", "issakɯ̥sɑkɯʑitsɯ̥")
-
-    def test_ゆうべ(self) -> None:
-        self.rewrites("ゆうべ", "yɯːbe")
-
-    def test_さくばん(self) -> None:
-        self.rewrites("さくばん", "sɑkɯbãɴ")
-
-    def test_さくゆう(self) -> None:
-        self.rewrites("さくゆう", "sɑkɯyɯː")
-
-    def test_さくや(self) -> None:
-        self.rewrites("さくや", "sɑkɯyɑ")
-
-    def test_やぜん(self) -> None:
-        self.rewrites("やぜん", "yɑzẽɴ")
-
-    def test_いっさくばん(self) -> None:
-        self.rewrites("いっさくばん", "issakɯbãɴ")
-
-    def test_せんばん(self) -> None:
-        self.rewrites("せんばん", "sẽɴbãɴ")
-
-    def test_せんや(self) -> None:
-        self.rewrites("せんや", "sẽɴyɑ")
-
-    def test_やらい(self) -> None:
-        self.rewrites("やらい", "yɑɾɑi")
-
-    def test_これまで(self) -> None:
-        self.rewrites("これまで", "koɾemɑde")
-
-    def test_じゅうらい(self) -> None:
-        self.rewrites("じゅうらい", "dʑɯːɾɑi")
-
-    def test_じゅうぜん(self) -> None:
-        self.rewrites("じゅうぜん", "dʑɯːzẽɴ")
-
-    def test_きゅうらい(self) -> None:
-        self.rewrites("きゅうらい", "kjɯːɾɑi")
-
-    def test_ざいらい(self) -> None:
-        self.rewrites("ざいらい", "zɑiɾɑi")
-
-    def test_ねんらい(self) -> None:
-        self.rewrites("ねんらい", "nẽɴɾɑi")
-
-    def test_こらい(self) -> None:
-        self.rewrites("こらい", "koɾɑi")
-
-    def test_えいねん(self) -> None:
-        self.rewrites("えいねん", "eːnẽɴ")
-
-    def test_ながねん(self) -> None:
-        self.rewrites("ながねん", "nɑŋɑnẽɴ")
-
-    def test_ながねん(self) -> None:
-        self.rewrites("ながねん", "nɑŋɑnẽɴ")
-
-    def test_たねん(self) -> None:
-        self.rewrites("たねん", "tɑnẽɴ")
-
-    def test_いぜん(self) -> None:
-        self.rewrites("いぜん", "izẽɴ")
-
-    def test_とう(self) -> None:
-        self.rewrites("とう", "toː")
-
-    def test_とっく(self) -> None:
-        self.rewrites("とっく", "tokkɯ")
-
-    def test_とうのむかし(self) -> None:
-        self.rewrites("とうのむかし", "toːnomɯkɑɕi̥")
-
-    def test_とっくのむかし(self) -> None:
-        self.rewrites("とっくのむかし", "tokkɯnomɯkɑɕi̥")
-
-    def test_しょうらい(self) -> None:
-        self.rewrites("しょうらい", "ɕoːɾɑi")
-
-    def test_みらい(self) -> None:
-        self.rewrites("みらい", "miɾɑi")
-
-    def test_みぜん(self) -> None:
-        self.rewrites("みぜん", "mizẽɴ")
-
-    def test_こんご(self) -> None:
-        self.rewrites("こんご", "kõɴŋo")
-
-    def test_こうご(self) -> None:
-        self.rewrites("こうご", "koːŋo")
-
-    def test_これから(self) -> None:
-        self.rewrites("これから", "koɾekɑɾɑ")
-
-    def test_このあと(self) -> None:
-        self.rewrites("このあと", "konoɑto")
-
-    def test_さき(self) -> None:
-        self.rewrites("さき", "sɑki")
-
-    def test_さきざき(self) -> None:
-        self.rewrites("さきざき", "sɑkizɑki̥")
-
-    def test_ゆくゆく(self) -> None:
-        self.rewrites("ゆくゆく", "yɯkɯyɯkɯ")
-
-    def test_あとあと(self) -> None:
-        self.rewrites("あとあと", "ɑtoɑto")
-
-    def test_のちのち(self) -> None:
-        self.rewrites("のちのち", "notɕinotɕi")
-
-    def test_さきゆき(self) -> None:
-        self.rewrites("さきゆき", "sɑkiyɯki")
-
-    def test_ゆくすえ(self) -> None:
-        self.rewrites("ゆくすえ", "yɯkɯ̥sɯe")
-
-    def test_ぜんと(self) -> None:
-        self.rewrites("ぜんと", "zẽɴto")
-
-    def test_いっすんさき(self) -> None:
-        self.rewrites("いっすんさき", "issɯ̃ɴsɑki̥")
-
-    def test_おいさき(self) -> None:
-        self.rewrites("おいさき", "oisɑki")
-
-    def test_おいさき(self) -> None:
-        self.rewrites("おいさき", "oisɑki")
-
-    def test_らいせ(self) -> None:
-        self.rewrites("らいせ", "ɾɑise")
-
-    def test_こうせい(self) -> None:
-        self.rewrites("こうせい", "koːseː")
-
-    def test_ごしょう(self) -> None:
-        self.rewrites("ごしょう", "ɡoɕoː")
-
-    def test_こうだい(self) -> None:
-        self.rewrites("こうだい", "koːdɑi")
-
-    def test_のちのよ(self) -> None:
-        self.rewrites("のちのよ", "notɕinoyo")
-
-    def test_いご(self) -> None:
-        self.rewrites("いご", "iŋo")
-
-    def test_すえ(self) -> None:
-        self.rewrites("すえ", "sɯe")
-
-    def test_のち(self) -> None:
-        self.rewrites("のち", "notɕi")
-
-    def test_むこう(self) -> None:
-        self.rewrites("むこう", "mɯkoː")
-
-    def test_ゆくえ(self) -> None:
-        self.rewrites("ゆくえ", "yɯkɯe")
-
-    def test_ゆくさき(self) -> None:
-        self.rewrites("ゆくさき", "yɯkɯ̥sɑki")
-
-    def test_いくさき(self) -> None:
-        self.rewrites("いくさき", "ikɯ̥sɑki")
-
-    def test_ごこく(self) -> None:
-        self.rewrites("ごこく", "ɡokokɯ̥")
-
-    def test_きんじつ(self) -> None:
-        self.rewrites("きんじつ", "kĩɴʑitsɯ̥")
-
-    def test_ごじつ(self) -> None:
-        self.rewrites("ごじつ", "ɡoʑitsɯ̥")
-
-    def test_こうねん(self) -> None:
-        self.rewrites("こうねん", "koːnẽɴ")
-
-    def test_そうばん(self) -> None:
-        self.rewrites("そうばん", "soːbãɴ")
-
-    def test_たじつ(self) -> None:
-        self.rewrites("たじつ", "tɑʑitsɯ̥")
+import engine
+import g2p
+import lexicon
 
-    def test_たねん(self) -> None:
-        self.rewrites("たねん", "tɑnẽɴ")
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
 
-    def test_やがて(self) -> None:
-        self.rewrites("やがて", "yɑŋɑte")
 
-    def test_もくしょうのかん(self) -> None:
-        self.rewrites("もくしょうのかん", "mokɯ̥ɕoːnokãɴ")
+# Shards of the gold tests, for running them across several processes; shard
+# `G2P_TEST_SHARD` (counting from zero) of `G2P_TEST_SHARDS` is run.
+SHARD = int(os.environ.get("G2P_TEST_SHARD", 0))
+NUM_SHARDS = int(os.environ.get("G2P_TEST_SHARDS", 1))
 
-    def test_もくぜん(self) -> None:
-        self.rewrites("もくぜん", "mokɯzẽɴ")
 
-    def test_まぢか(self) -> None:
-        self.rewrites("まぢか", "mɑʑikɑ")
+def read_gold(path: str = JPD_PATH) -> List[Tuple[str, str]]:
+    """Reads the distinct (word, transcription) pairs in a gold TSV file."""
+    return list(dict.fromkeys(lexicon.read_entries(path)))
 
-    def test_みょうねん(self) -> None:
-        self.rewrites("みょうねん", "mjoːnẽɴ")
 
-    def test_らいねん(self) -> None:
-        self.rewrites("らいねん", "ɾɑinẽɴ")
+class G2PTest(unittest.TestCase):
+    """Checks each entry of `jpd.tsv`.
 
-    def test_みょうしゅん(self) -> None:
-        self.rewrites("みょうしゅん", "mjoːɕɯ̃ɴ")
+    A `test_<word>` method is generated for each entry in this shard; the
+    words are transcribed in one batch, when the class is set up.
+    """
 
-    def test_らいしゅん(self) -> None:
-        self.rewrites("らいしゅん", "ɾɑiɕɯ̃ɴ")
+    gold = [
+        pair for i, pair in enumerate(read_gold()) if i % NUM_SHARDS == SHARD
+    ]
 
-    def test_らいはる(self) -> None:
-        self.rewrites("らいはる", "ɾɑihɑɾɯ")
+    @classmethod
+    def setUpClass(cls) -> None:
+        words = [word for word, _ in cls.gold]
+        cls.results = dict(zip(words, g2p.g2p_batch(words)))
 
-    def test_さらいねん(self) -> None:
-        self.rewrites("さらいねん", "sɑɾɑinẽɴ")
+    def rewrites(self, istring: str, expected_ostring: str) -> None:
+        """Asserts that the g2p rule produces the correct output.
 
-    def test_みょうごねん(self) -> None:
-        self.rewrites("みょうごねん", "mjoːŋonẽɴ")
+        Note that this itself is not a unit test because its name does not
+        begin with `test_`; but it can be used to implement other unit tests.
 
-    def test_らいがくねん(self) -> None:
-        self.rewrites("らいがくねん", "ɾɑiŋɑkɯnẽɴ")
+        Args:
+            istring: the input string
+            expected_ostring: the expected output string.
+        """
+        ostring = self.results[istring]
+        if isinstance(ostring, g2p.rewrite.Error):
+            raise ostring
+        self.assertEqual(ostring, expected_ostring)
 
-    def test_らいがっき(self) -> None:
-        self.rewrites("らいがっき", "ɾɑiŋɑk̚ki̥")
 
-    def test_らいき(self) -> None:
-        self.rewrites("らいき", "ɾɑiki̥")
+def _add_gold_tests(cls: type) -> None:
+    for word, expected in cls.gold:
+        name = f"test_{word}"
+        suffix = 1
+        while hasattr(cls, name):
+            suffix += 1
+            name = f"test_{word}_{suffix}"
+
+        def test(self, word=word, expected=expected) -> None:
+            self.rewrites(word, expected)
+
+        test.__name__ = name
+        setattr(cls, name, test)
+
+
+_add_gold_tests(G2PTest)
+
+
+class G2PBatchTest(unittest.TestCase):
+    def test_matches_g2p(self) -> None:
+        words = [word for word, _ in lexicon.read_entries(JPD_PATH)]
+        self.assertEqual(g2p.g2p_batch(words), [g2p.g2p(w) for w in words])
+
+    def test_errors(self) -> None:
+        results = g2p.g2p_batch(["じか", "abc", "じか"])
+        self.assertEqual(results[0], "dʑikɑ")
+        self.assertIsInstance(results[1], g2p.rewrite.Error)
+        self.assertEqual(results[2], "dʑikɑ")
+
+
+class SegmentTest(unittest.TestCase):
+    def test_segment(self) -> None:
+        self.assertEqual(
+            g2p.segment("ɾʲoːtsɯ̥ɰ̃"),
+            ["ɾ", "ʲ", "o", "ː", "t", "s", "ɯ̥", "ɰ̃"],
+        )
+
+    def test_unknown(self) -> None:
+        self.assertEqual(g2p.segment("k̚ka"), ["k̚", "k", "a"])
+
+
+class NormalizeTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        g2p.set_input_policy("raise")
+
+    def test_katakana(self) -> None:
+        self.assertEqual(g2p.normalize("ガッコウ"), "がっこう")
+        self.assertEqual(g2p.normalize("ｶﾞｯｺｳ"), "がっこう")
+
+    def test_long_vowel_mark(self) -> None:
+        self.assertEqual(g2p.normalize("カード"), "かあど")
+        self.assertEqual(g2p.normalize("きゃー"), "きゃあ")
+
+    def test_invalid(self) -> None:
+        for istring in (
+            "abc",
+            "ーか",
+            "んー",
+            "ゃか",
+            "かっ",
+            "かっあ",
+            "っっか",
+        ):
+            with self.subTest(istring=istring):
+                with self.assertRaises(g2p.InputError):
+                    g2p.normalize(istring)
+                self.assertIsNone(g2p.normalize(istring, "skip"))
+
+    def test_repair(self) -> None:
+        self.assertEqual(g2p.normalize("かaき", "repair"), "かき")
+        self.assertEqual(g2p.normalize("ゃか", "repair"), "やか")
+        self.assertEqual(g2p.normalize("かっあ", "repair"), "かあ")
+        self.assertEqual(g2p.normalize("かっ", "repair"), "か")
+
+    def test_policy(self) -> None:
+        self.assertEqual(g2p.g2p("ジカ"), "dʑikɑ")
+        with self.assertRaises(g2p.InputError):
+            g2p.g2p("じaか")
+        self.assertIsInstance(g2p.g2p_batch(["じaか"])[0], g2p.InputError)
+        g2p.set_input_policy("repair")
+        self.assertEqual(g2p.g2p("じaか"), "dʑikɑ")
+        self.assertEqual(g2p.g2p_batch(["じaか"]), ["dʑikɑ"])
+        with self.assertRaises(ValueError):
+            g2p.set_input_policy("skip")
+
+
+class LongTextTest(unittest.TestCase):
+    def test_safe_cuts(self) -> None:
+        cuts = g2p.safe_cuts()
+        self.assertIn("かか", cuts)
+        # Gemination, digraphs, nasalization and long vowels span the cut.
+        for cut in ("っか", "きゃ", "かん", "おう"):
+            self.assertNotIn(cut, cuts)
+
+    def test_matches_whole(self) -> None:
+        text = "".join(word for word, _ in read_gold()[:100])
+        expected = g2p.g2p(text)
+        for segment_length in (1, g2p.SEGMENT_LENGTH):
+            with self.subTest(segment_length=segment_length):
+                self.assertEqual(g2p.g2p_text(text, segment_length), expected)
+
+    def test_normalizes(self) -> None:
+        self.assertEqual(g2p.g2p_text("ジカ", 1), "dʑikɑ")
+        with self.assertRaises(g2p.InputError):
+            g2p.g2p_text("じaか")
+
+
+class PhonemeIdTest(unittest.TestCase):
+    def test_phoneme_ids(self) -> None:
+        ids = g2p.phoneme_ids("ɾʲoːtsɯ̥ɰ̃")
+        self.assertEqual(
+            [g2p.PHONEME_INVENTORY[i] for i in ids],
+            ["ɾ", "ʲ", "o", "ː", "t", "s", "ɯ̥", "ɰ̃"],
+        )
+        with self.assertRaises(ValueError):
+            g2p.phoneme_ids("k̚")
+
+    def test_g2p_ids(self) -> None:
+        self.assertEqual(
+            list(g2p.g2p_ids("じか")),
+            [
+                g2p.PHONEME_IDS[phoneme]
+                for phoneme in ("d", "ʑ", "i", "k", "ɑ")
+            ],
+        )
+
+    def test_batch(self) -> None:
+        words = ["じか", "abc", "げんか", "じか"]
+        batch = g2p.g2p_ids_batch(words)
+        self.assertEqual(len(batch.offsets), len(words) + 1)
+        self.assertEqual(list(batch.errors), [1])
+        self.assertIsInstance(batch.errors[1], g2p.rewrite.Error)
+        for i, word in enumerate(words):
+            if i in batch.errors:
+                self.assertEqual(batch.offsets[i], batch.offsets[i + 1])
+            else:
+                self.assertEqual(
+                    batch.ids[batch.offsets[i] : batch.offsets[i + 1]],
+                    g2p.g2p_ids(word),
+                )
+
+    def test_passed_through_grapheme(self) -> None:
+        self.assertEqual(g2p.g2p("をか"), "をkɑ")
+        with self.assertRaises(g2p.PhonemeError):
+            g2p.g2p_ids("をか")
+        self.assertEqual(list(g2p.g2p_ids_batch(["をか"]).errors), [0])
+
+
+class SymbolTableTest(unittest.TestCase):
+    def test_tokens(self) -> None:
+        self.assertEqual(g2p._tokens("ɕɯ̥ɰ̃ː"), "ɕ ɯ̥ ɰ̃ ː")
+        with self.assertRaises(ValueError):
+            g2p._tokens("じx")
+
+    def test_one_label_per_symbol(self) -> None:
+        fst = g2p._compile("しゅっぱつ")
+        self.assertEqual(fst.num_states(), 6)
+        labels = {
+            label
+            for state in g2p.G2P.states()
+            for arc in g2p.G2P.arcs(state)
+            for label in (arc.ilabel, arc.olabel)
+        }
+        self.assertLess(max(labels), g2p.SYMBOLS.num_symbols())
+
+
+class ExceptionLexiconTest(unittest.TestCase):
+    def setUp(self) -> None:
+        g2p.set_lexicon(
+            lexicon.Lexicon([("じか", "ʑikɑ"), ("かあど", "kaːdo")])
+        )
+
+    def tearDown(self) -> None:
+        g2p.set_lexicon(None)
+
+    def test_ids_outside_inventory(self) -> None:
+        g2p.set_lexicon(lexicon.Lexicon([("さっき", "sɑk̚ki̥")]))
+        with self.assertRaises(g2p.PhonemeError):
+            g2p.g2p_ids("さっき")
+        batch = g2p.g2p_ids_batch(["じか", "さっき", "さっき"])
+        self.assertEqual(sorted(batch.errors), [1, 2])
+        self.assertIsInstance(batch.errors[1], g2p.rewrite.Error)
+        self.assertEqual(
+            batch.ids[batch.offsets[0] : batch.offsets[1]], g2p.g2p_ids("じか")
+        )
+        self.assertEqual(batch.offsets[1], batch.offsets[3])
+
+    def test_lookup(self) -> None:
+        self.assertEqual(g2p.g2p("じか"), "ʑikɑ")
+        self.assertEqual(g2p.g2p("カード"), "kaːdo")
+        self.assertEqual(g2p.g2p("げんか"), "ɡẽɴkɑ")
+        self.assertEqual(
+            g2p.g2p_batch(["じか", "げんか", "abc"])[:2], ["ʑikɑ", "ɡẽɴkɑ"]
+        )
+        self.assertEqual(g2p.g2p_text("じか"), "ʑikɑ")
+
+    def test_normalizes_once(self) -> None:
+        calls = []
+        normalize = g2p.normalize
+
+        def counting_normalize(istring, policy="raise"):
+            calls.append(istring)
+            return normalize(istring, policy)
+
+        g2p.normalize = counting_normalize
+        try:
+            for _ in range(2):
+                self.assertEqual(g2p.g2p("カード"), "kaːdo")
+                self.assertEqual(g2p.g2p("げんか"), "ɡẽɴkɑ")
+        finally:
+            g2p.normalize = normalize
+        self.assertEqual(calls, ["カード", "げんか"])
+
+    def test_reload(self) -> None:
+        self.assertEqual(g2p.g2p("じか"), "ʑikɑ")
+        self.assertEqual(g2p.g2p("カード"), "kaːdo")
+        g2p.set_lexicon(None)
+        self.assertEqual(g2p.g2p("じか"), "dʑikɑ")
+        self.assertNotEqual(g2p.g2p("カード"), "kaːdo")
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "lexicon.tsv")
+            lexicon.write_sorted([("じか", "ʑikɑ")], path)
+            g2p.load_lexicon(path, use_mmap=True)
+            self.assertEqual(g2p.g2p("じか"), "ʑikɑ")
+
+
+class ThreadSafetyTest(unittest.TestCase):
+    def test_concurrent(self) -> None:
+        words = [word for word, _ in read_gold()[:400]]
+        expected = [str(result) for result in g2p.g2p_batch(words)]
+        g2p.cache_clear()
+        results: List[List[str]] = [[] for _ in range(8)]
+
+        def transcribe(i: int) -> None:
+            for word in words:
+                try:
+                    results[i].append(g2p.g2p(word))
+                except g2p.rewrite.Error as error:
+                    results[i].append(str(error))
+
+        threads = [
+            threading.Thread(target=transcribe, args=(i,)) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            self.assertEqual(result, expected)
+
+    def test_thread_pool_batch(self) -> None:
+        words = [word for word, _ in read_gold()[:400]] + ["abc", "じか"]
+        self.assertEqual(
+            [str(result) for result in g2p.g2p_batch(words, threads=4)],
+            [str(result) for result in g2p.g2p_batch(words)],
+        )
+
+
+class EngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = g2p.compile_engine()
+
+    def test_matches_g2p(self) -> None:
+        for word, _ in lexicon.read_entries(JPD_PATH):
+            self.assertEqual(self.engine.transcribe(word), g2p.g2p(word))
+
+    def test_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "g2p.engine")
+            self.engine.save(path)
+            loaded = engine.Engine.load(path)
+        self.assertEqual(loaded.transcribe("きょうあす"), "kjoːɑsɯ̥")
+
+    def test_memory_mapped(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "g2p.engine")
+            self.engine.key = "abc"
+            self.engine.save(path)
+            loaded = engine.Engine.load(path, use_mmap=True)
+            self.assertEqual(loaded.key, "abc")
+            self.assertEqual(loaded.transcribe("きょうあす"), "kjoːɑsɯ̥")
+
+    def test_unknown_character(self) -> None:
+        with self.assertRaises(engine.Error):
+            self.engine.transcribe("abc")
+
+
+class EngineModeTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        g2p.set_mode("composed")
+
+    def test_matches_composed(self) -> None:
+        words = [word for word, _ in read_gold()]
+        expected = g2p.g2p_batch(words)
+        g2p.set_mode("engine")
+        self.assertEqual(g2p.g2p_batch(words), expected)
+        self.assertEqual([g2p.g2p(word) for word in words], expected)
+        self.assertIsNone(g2p._grammar)
+
+    def test_errors(self) -> None:
+        g2p.set_mode("engine")
+        with self.assertRaises(g2p.rewrite.Error):
+            g2p.g2p("abc")
+
+    def test_rebuild(self) -> None:
+        g2p.set_mode("engine")
+        self.assertEqual(g2p.g2p("さか"), "sɑkɑ")
+        stages = g2p.STAGES
+        try:
+            g2p.STAGES = stages + [("a", g2p.cross_symbols("ɑ", "a"), "", "")]
+            g2p.rebuild()
+            self.assertEqual(g2p.g2p("さか"), "saka")
+        finally:
+            g2p.STAGES = stages
+            g2p.rebuild()
+        self.assertEqual(g2p.g2p("さか"), "sɑkɑ")
+
+
+class BuildStatsTest(unittest.TestCase):
+    def test_build_stats(self) -> None:
+        stats = g2p.build_stats()
+        self.assertEqual(
+            [row.name for row in stats], [stage[0] for stage in g2p.STAGES]
+        )
+        self.assertEqual(stats[-1].optimized_states, g2p.G2P.num_states())
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        g2p.cache_clear()
+
+    def tearDown(self) -> None:
+        g2p.set_cache_size(g2p.CACHE_SIZE)
+        g2p.cache_clear()
+
+    def test_hits_and_misses(self) -> None:
+        self.assertEqual(g2p.g2p("じか"), "dʑikɑ")
+        self.assertEqual(g2p.g2p("じか"), "dʑikɑ")
+        info = g2p.cache_info()
+        self.assertEqual((info.hits, info.misses, info.size), (1, 1, 1))
+
+    def test_eviction(self) -> None:
+        g2p.set_cache_size(2)
+        for word in ("じか", "げんか", "じか", "ことし"):
+            g2p.g2p(word)
+        info = g2p.cache_info()
+        self.assertEqual((info.evictions, info.size), (1, 2))
+        g2p.g2p("じか")
+        self.assertEqual(g2p.cache_info().hits, 2)
+
+    def test_rebuild_clears(self) -> None:
+        g2p.g2p("じか")
+        g2p.rebuild()
+        self.assertEqual(g2p.cache_info().size, 0)
+
+    def test_clear_during_rewrite(self) -> None:
+        normalize = g2p.normalize
+
+        def clearing_normalize(istring, policy="raise"):
+            # As if another thread rebuilt the grammar meanwhile.
+            g2p.cache_clear()
+            return normalize(istring, policy)
+
+        g2p.normalize = clearing_normalize
+        try:
+            self.assertEqual(g2p.g2p("じか"), "dʑikɑ")
+        finally:
+            g2p.normalize = normalize
+        self.assertEqual(g2p.cache_info().size, 0)
+        g2p.g2p("じか")
+        self.assertEqual(g2p.cache_info().size, 1)
+
+
+class MainTest(unittest.TestCase):
+    def run_main(self, stdin: str, *args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, "-m", "g2p", *args],
+            input=stdin,
+            capture_output=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            encoding="utf8",
+        )
+
+    def test_stdin(self) -> None:
+        process = self.run_main("じか\nげんか\tɡẽɴkɑ\n")
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(process.stdout, "じか\tdʑikɑ\nげんか\tɡẽɴkɑ\n")
+
+    def test_errors(self) -> None:
+        stdin = "じか\nabc\nげんか\n"
+        process = self.run_main(stdin)
+        self.assertEqual(process.returncode, 1)
+        self.assertEqual(process.stdout, "じか\tdʑikɑ\n")
+        process = self.run_main(stdin, "--errors", "skip")
+        self.assertEqual(process.stdout, "じか\tdʑikɑ\nげんか\tɡẽɴkɑ\n")
+        process = self.run_main(stdin, "--errors", "report")
+        self.assertEqual(process.stdout, "じか\tdʑikɑ\nabc\t\nげんか\tɡẽɴkɑ\n")
+        self.assertIn("<stdin>:2", process.stderr)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "lexicon.tsv")
+            with open(path, "w", encoding="utf8") as sink:
+                sink.write("abc\tabc\n")
+            process = self.run_main(stdin, "--lexicon", path)
+        self.assertEqual(
+            process.stdout, "じか\tdʑikɑ\nabc\tabc\nげんか\tɡẽɴkɑ\n"
+        )
+        process = self.run_main(stdin, "--repair")
+        self.assertEqual(process.stdout, "じか\tdʑikɑ\nabc\t\nげんか\tɡẽɴkɑ\n")
+
+
+class CascadeModeTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        g2p.set_mode("composed")
+
+    def test_matches_composed(self) -> None:
+        words = [word for word, _ in lexicon.read_entries(JPD_PATH)]
+        expected = g2p.g2p_batch(words)
+        g2p.set_mode("cascade")
+        self.assertEqual(g2p.g2p_batch(words), expected)
+        self.assertEqual([g2p.g2p(word) for word in words], expected)
+        self.assertIsNone(g2p._grammar)
+
+    def test_errors(self) -> None:
+        g2p.set_mode("cascade")
+        with self.assertRaises(g2p.rewrite.Error):
+            g2p.g2p("abc")
+
+    def test_unknown_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            g2p.set_mode("lazy")
+
+    def test_rebuild(self) -> None:
+        g2p.set_mode("cascade")
+        self.assertEqual(g2p.g2p("さか"), "sɑkɑ")
+        stages = g2p.STAGES
+        try:
+            g2p.STAGES = stages + [("a", g2p.cross_symbols("ɑ", "a"), "", "")]
+            g2p.rebuild()
+            self.assertIsNone(g2p._grammar)
+            self.assertEqual(g2p.g2p("さか"), "saka")
+        finally:
+            g2p.STAGES = stages
+            g2p.rebuild()
+        self.assertEqual(g2p.g2p("さか"), "sɑkɑ")
+
+
+class BuildProfileTest(unittest.TestCase):
+    def test_profiles(self) -> None:
+        words = [word for word, _ in read_gold()[:200]]
+        expected = [str(result) for result in g2p.g2p_batch(words)]
+        sizes = {}
+        for profile in g2p.PROFILES:
+            with self.subTest(profile=profile):
+                fst = g2p.build(profile=profile)
+                sizes[profile] = fst.num_states()
+                results = []
+                for word in words:
+                    try:
+                        results.append(g2p._top_rewrite(word, fst))
+                    except g2p.rewrite.Error as error:
+                        results.append(str(error))
+                self.assertEqual(results, expected)
+        self.assertGreater(sizes["fast"], sizes["full"])
+        self.assertEqual(sizes["staged"], sizes["full"])
+        self.assertTrue(
+            g2p.build(profile="full").properties(pynini.I_LABEL_SORTED, True)
+        )
+
+    def test_archive_profile(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "g2p.far")
+            g2p.save(g2p.build(profile="fast"), path, profile="fast")
+            self.assertIsNotNone(g2p.load(path, profile="fast"))
+            self.assertIsNone(g2p.load(path, profile="full"))
+
+    def test_unknown_profile(self) -> None:
+        with self.assertRaises(ValueError):
+            g2p.build(profile="slow")
+        with self.assertRaises(ValueError):
+            g2p.set_profile("slow")
+
+
+class GrammarArtifactTest(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "g2p.far")
+            g2p.save(g2p.G2P, path)
+            fst = g2p.load(path)
+            self.assertIsNotNone(fst)
+            self.assertEqual(fst.write_to_string(), g2p.G2P.write_to_string())
+
+    def test_missing_archive(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.assertIsNone(g2p.load(os.path.join(tempdir, "g2p.far")))
+
+    def test_stale_archive(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "g2p.far")
+            g2p.save(g2p.G2P, path)
+            stages = g2p.STAGES
+            try:
+                g2p.STAGES = stages[:-1]
+                self.assertIsNone(g2p.load(path))
+            finally:
+                g2p.STAGES = stages
+
+
+class StageCacheTest(unittest.TestCase):
+    def assertIsomorphic(self, fst1: pynini.Fst, fst2: pynini.Fst) -> None:
+        self.assertTrue(pynini.isomorphic(fst1, fst2))
+
+    def test_incremental_build(self) -> None:
+        stages = list(g2p.STAGES)
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.assertIsomorphic(g2p.build(tempdir), g2p.G2P)
+            self.assertIsomorphic(g2p.build(tempdir), g2p.G2P)
+            name, _, left, right = stages[-1]
+            try:
+                g2p.STAGES[-1] = (
+                    name,
+                    g2p.cross_symbols("ɑ", "a"),
+                    left,
+                    right,
+                )
+                self.assertIsomorphic(g2p.build(tempdir), g2p.build())
+            finally:
+                g2p.STAGES[:] = stages
+            self.assertIsomorphic(g2p.build(tempdir), g2p.G2P)
+
+    def test_prunes_stale_entries(self) -> None:
+        stages = list(g2p.STAGES)
+        with tempfile.TemporaryDirectory() as tempdir:
+            os.mkdir(os.path.join(tempdir, "outputs"))
+            g2p.build(tempdir)
+            entries = set(os.listdir(tempdir))
+            name, _, left, right = stages[-1]
+            try:
+                g2p.STAGES[-1] = (
+                    name,
+                    g2p.cross_symbols("ɑ", "a"),
+                    left,
+                    right,
+                )
+                g2p.build(tempdir)
+                self.assertNotEqual(set(os.listdir(tempdir)), entries)
+            finally:
+                g2p.STAGES[:] = stages
+            g2p.build(tempdir)
+            self.assertEqual(set(os.listdir(tempdir)), entries)
+
+
+class LazyGrammarTest(unittest.TestCase):
+    def test_import_does_not_load(self) -> None:
+        code = "import g2p; g2p.graphemes; assert g2p._grammar is None"
+        subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+    def test_builds_once(self) -> None:
+        calls = []
+        load_or_build = g2p._load_or_build
+        saved = g2p._grammar
+
+        def counting_load_or_build():
+            calls.append(None)
+            return load_or_build()
+
+        g2p._load_or_build = counting_load_or_build
+        g2p._grammar = None
+        try:
+            threads = [threading.Thread(target=g2p.warmup) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            g2p._load_or_build = load_or_build
+            g2p._grammar = saved
+        self.assertEqual(len(calls), 1)
 
 
 if __name__ == "__main__":
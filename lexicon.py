@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""Exception lexicons for Hiragana G2P.
+
+An exception lexicon gives the pronunciation of irregular words directly;
+`g2p.g2p` consults it before the grammar, and hits skip composition entirely.
+Lexicons are read from TSV files in the format of `jpd.tsv`: a word and its
+transcription on each line.
+
+There are two backends. `Lexicon` holds the entries in a dict. `SortedLexicon`
+binary-searches a TSV file sorted by word, memory-mapped in place, so large
+lists take no time to load and their pages are shared by every process which
+maps them; run this module to sort a TSV file for it.
+"""
+
+import argparse
+import mmap
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+
+def read_entries(path: str) -> Iterator[Tuple[str, str]]:
+    """Yields the (word, transcription) entries of a TSV file.
+
+    Args:
+      path: the input path.
+
+    Yields:
+      The first two columns of each line which has them.
+    """
+    with open(path, "r", encoding="utf8") as source:
+        for line in source:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) >= 2 and columns[0]:
+                yield columns[0], columns[1]
+
+
+def read_words(path: str) -> Iterator[str]:
+    """Yields the words in a word list or TSV file.
+
+    Args:
+      path: the input path.
+
+    Yields:
+      The first column of each non-empty line.
+    """
+    with open(path, "r", encoding="utf8") as source:
+        for line in source:
+            word = line.rstrip("\n").split("\t", 1)[0].strip()
+            if word:
+                yield word
+
+
+class Lexicon:
+    """An exception lexicon held in a dict.
+
+    Args:
+      entries: the (word, transcription) entries; where a word has several,
+        the first is used.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = ()):
+        self._entries: Dict[str, str] = {}
+        for word, ostring in entries:
+            self._entries.setdefault(word, ostring)
+
+    @classmethod
+    def from_tsv(cls, path: str) -> "Lexicon":
+        return cls(read_entries(path))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._entries
+
+    def get(self, word: str) -> Optional[str]:
+        """Looks up a word.
+
+        Args:
+          word: the graphemic string.
+
+        Returns:
+          Its transcription, or None if it is not in the lexicon.
+        """
+        return self._entries.get(word)
+
+
+class SortedLexicon:
+    """An exception lexicon backed by a memory-mapped sorted TSV file.
+
+    The lines of the file must be sorted by the UTF-8 bytes of their first
+    column, as `write_sorted` does; where a word has several entries, any of
+    them may be used.
+
+    Args:
+      path: the sorted TSV path.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as source:
+            try:
+                self._data: Union[mmap.mmap, bytes] = mmap.mmap(
+                    source.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:
+                # Empty files cannot be mapped.
+                self._data = b""
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def get(self, word: str) -> Optional[str]:
+        """Looks up a word by binary search.
+
+        Args:
+          word: the graphemic string.
+
+        Returns:
+          Its transcription, or None if it is not in the lexicon.
+        """
+        data = self._data
+        key = word.encode("utf8")
+        low = 0
+        high = len(data)
+        # Both bounds are always at the start of a line.
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b"\n", 0, middle) + 1
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = len(data)
+            line = data[start:end]
+            tab = line.find(b"\t")
+            found = line if tab < 0 else line[:tab]
+            if found < key:
+                low = end + 1
+            elif found > key:
+                high = start
+            elif tab < 0:
+                return None
+            else:
+                return line[tab + 1 :].split(b"\t", 1)[0].decode("utf8")
+        return None
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+def write_sorted(entries: Iterable[Tuple[str, str]], path: str) -> int:
+    """Writes entries to a TSV file for `SortedLexicon`.
+
+    Args:
+      entries: the (word, transcription) entries; where a word has several,
+        the first is kept.
+      path: the output path.
+
+    Returns:
+      The number of entries written.
+    """
+    lexicon = Lexicon(entries)
+    words = sorted(lexicon._entries, key=lambda word: word.encode("utf8"))
+    with open(path, "w", encoding="utf8", newline="\n") as sink:
+        for word in words:
+            sink.write(f"{word}\t{lexicon.get(word)}\n")
+    return len(words)
+
+
+def load(path: str, use_mmap: bool = False) -> Union[Lexicon, SortedLexicon]:
+    """Loads an exception lexicon.
+
+    Args:
+      path: the TSV path.
+      use_mmap: if true, the file must be sorted, and is memory-mapped as a
+        `SortedLexicon`; otherwise it is read into a `Lexicon`.
+
+    Returns:
+      The lexicon.
+    """
+    return SortedLexicon(path) if use_mmap else Lexicon.from_tsv(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Sorts a lexicon TSV file for memory-mapped lookup."
+    )
+    parser.add_argument("input", help="lexicon TSV file")
+    parser.add_argument("output", help="sorted TSV file")
+    args = parser.parse_args()
+    write_sorted(read_entries(args.input), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Unit tests for exception lexicons."""
+
+import os
+import tempfile
+import unittest
+
+import lexicon
+
+ENTRIES = [
+    ("はし", "hɑɕi"),
+    ("あ", "ɑ"),
+    ("ゆう", "jɯː"),
+    ("はし", "hɑɕiː"),
+    ("んん", "ɴɴ"),
+]
+
+
+class LexiconTest(unittest.TestCase):
+    def test_first_entry_wins(self) -> None:
+        exceptions = lexicon.Lexicon(ENTRIES)
+        self.assertEqual(len(exceptions), 4)
+        self.assertEqual(exceptions.get("はし"), "hɑɕi")
+        self.assertIsNone(exceptions.get("は"))
+        self.assertIn("あ", exceptions)
+
+
+class ReadWordsTest(unittest.TestCase):
+    def test_read_words(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            for name, text in (
+                ("words.txt", "はし\n\nあ \nゆう\n"),
+                ("words.tsv", "はし\thɑɕi\n\nあ\tɑ\nゆう\tjɯː\n"),
+            ):
+                path = os.path.join(tempdir, name)
+                with open(path, "w", encoding="utf8") as sink:
+                    sink.write(text)
+                self.assertEqual(
+                    list(lexicon.read_words(path)), ["はし", "あ", "ゆう"]
+                )
+
+
+class SortedLexiconTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "sorted.tsv")
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_lookup(self) -> None:
+        self.assertEqual(lexicon.write_sorted(ENTRIES, self.path), 4)
+        exceptions = lexicon.load(self.path, use_mmap=True)
+        try:
+            for word, ostring in dict(reversed(ENTRIES)).items():
+                self.assertEqual(exceptions.get(word), ostring)
+            for word in ("", "ぁ", "は", "はしし", "ゆ", "んんん"):
+                self.assertIsNone(exceptions.get(word))
+        finally:
+            exceptions.close()
+
+    def test_matches_dict(self) -> None:
+        words = [f"{i:05d}" for i in range(0, 2000, 3)]
+        lexicon.write_sorted(((word, word[::-1]) for word in words), self.path)
+        exceptions = lexicon.SortedLexicon(self.path)
+        try:
+            for i in range(2000):
+                word = f"{i:05d}"
+                self.assertEqual(
+                    exceptions.get(word), word[::-1] if i % 3 == 0 else None
+                )
+        finally:
+            exceptions.close()
+
+    def test_empty(self) -> None:
+        open(self.path, "w").close()
+        exceptions = lexicon.SortedLexicon(self.path)
+        self.assertIsNone(exceptions.get("あ"))
+        exceptions.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+"""Differential regression testing between two builds of the G2P grammar.
+
+A corpus is transcribed with a baseline and a candidate grammar, and only the
+words whose transcriptions differ are reported, grouped by how their phonemes
+changed, with counts and examples. Each grammar is one of:
+
+  a FAR file written by `g2p.save`, applied with this tree's input
+    normalization;
+  a git revision, whose own `g2p` module is imported from an exported copy
+    of its tree;
+  the working tree, the default candidate.
+
+The two grammars transcribe at the same time, each across its own process
+pool, and each distinct word is only transcribed once. The outputs of a
+grammar with a fixed identity, a commit or the contents of a FAR file, are
+cached by word, so that rerunning against the same baseline only transcribes
+words it has not seen before.
+"""
+
+import argparse
+import collections
+import contextlib
+import difflib
+import functools
+import hashlib
+import importlib
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from types import ModuleType
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from pynini import Far
+
+import bulk
+import g2p
+import tables
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+JPD_PATH = os.path.join(REPO_DIR, "jpd.tsv")
+
+# Cached outputs, one TSV file per grammar, named by its key; see `resolve`.
+# A file only holds the words transcribed so far, so removing it just means
+# that they are transcribed again.
+CACHE_DIR = os.path.join(REPO_DIR, ".g2p_cache", "outputs")
+
+CHUNK_SIZE = 1024
+
+# Examples reported per change.
+EXAMPLES = 3
+
+# Stands for any transcription, in a change where the other side failed.
+ANY = "*"
+
+
+class Grammar(NamedTuple):
+    """A grammar to transcribe with; see `resolve`."""
+
+    kind: str
+    location: Optional[str]
+    key: Optional[str]
+    name: str
+
+
+class Change(NamedTuple):
+    """A change in transcription, and the words it applies to.
+
+    The two transcriptions of each word are aligned by phoneme, and each run
+    of phonemes which differ is a change; a word with several is counted
+    under each. A side is None if the word could not be transcribed, in which
+    case the other side is `ANY`.
+    """
+
+    baseline: Optional[str]
+    candidate: Optional[str]
+    words: int
+    tokens: int
+    examples: List[Tuple[str, Optional[str], Optional[str]]]
+
+
+class Diff(NamedTuple):
+    """The differences between two grammars over a corpus."""
+
+    baseline: str
+    candidate: str
+    words: int
+    distinct_words: int
+    changed_words: int
+    changed_distinct_words: int
+    changes: List[Change]
+
+
+def _git(*args: str) -> bytes:
+    return subprocess.run(
+        ["git", *args], capture_output=True, check=True, cwd=REPO_DIR
+    ).stdout
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resolve(spec: Optional[str], tmp_dir: str) -> Grammar:
+    """Resolves a grammar specification.
+
+    Args:
+      spec: the path of a FAR file, a git revision, or None for the working
+        tree.
+      tmp_dir: the directory to export revisions to.
+
+    Returns:
+      The grammar.
+
+    Raises:
+      ValueError: the specification is neither a file nor a revision.
+    """
+    if spec is None:
+        return Grammar("worktree", None, None, "working tree")
+    if os.path.isfile(spec):
+        # Archives are applied after this tree's input normalization, so
+        # their outputs depend on it as much as on the archive.
+        key = hashlib.sha256(
+            f"{_file_digest(spec)}-{g2p.normalization_hash()}".encode("ascii")
+        ).hexdigest()
+        return Grammar("far", os.path.abspath(spec), f"far-{key}", spec)
+    try:
+        commit = _git("rev-parse", "--verify", f"{spec}^{{commit}}")
+    except (OSError, subprocess.CalledProcessError) as error:
+        raise ValueError(
+            f"Not a FAR file or git revision: {spec!r}"
+        ) from error
+    commit = commit.decode("ascii").strip()
+    location = os.path.join(tmp_dir, commit)
+    if not os.path.isdir(location):
+        archive = _git("archive", "--format=tar", commit)
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(location)
+    return Grammar("revision", location, f"rev-{commit}", spec)
+
+
+def _try(function: Callable[[str], str], word: str):
+    try:
+        return function(word)
+    except Exception as error:
+        return error
+
+
+def _apply(module: ModuleType, words: List[str]) -> List[Optional[str]]:
+    """Transcribes with a `g2p` module, of this or any earlier revision."""
+    if hasattr(module, "g2p_batch"):
+        results = module.g2p_batch(words)
+    else:
+        results = [_try(module.g2p, word) for word in words]
+    return [
+        None if isinstance(result, Exception) else result for result in results
+    ]
+
+
+def _apply_fst(fst, words: List[str]) -> List[Optional[str]]:
+    results = []
+    for word in words:
+        try:
+            results.append(g2p.apply_grammar(fst, word))
+        except g2p.rewrite.Error:
+            results.append(None)
+    return results
+
+
+def _load_far(path: str):
+    """Loads a grammar from a FAR, relabelled to `g2p.SYMBOLS`.
+
+    Archives with no symbol tables were compiled over bytes, before
+    `g2p.SYMBOLS`, and are left as they are; `g2p.apply_grammar` applies them
+    over bytes. Archives with only one table are assumed to use
+    `g2p.SYMBOLS`.
+    """
+    with Far(path, "r") as source:
+        fst = source.get_fst()
+    tables = [fst.input_symbols(), fst.output_symbols()]
+    if all(table is not None for table in tables):
+        for table in tables:
+            for _, symbol in table:
+                g2p.SYMBOLS.add_symbol(symbol)
+        fst.relabel_tables(new_isymbols=g2p.SYMBOLS, new_osymbols=g2p.SYMBOLS)
+    return fst.arcsort("ilabel")
+
+
+def _import_revision(location: str) -> ModuleType:
+    """Imports `g2p` from an exported tree in place of this tree's."""
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if (
+            name not in ("__main__", __name__)
+            and path is not None
+            and os.path.dirname(os.path.abspath(path)) == REPO_DIR
+        ):
+            del sys.modules[name]
+    sys.path.insert(0, location)
+    return importlib.import_module("g2p")
+
+
+_transcribe: Optional[Callable[[List[str]], List[Optional[str]]]] = None
+
+
+def _init_worker(kind: str, location: Optional[str]) -> None:
+    global _transcribe
+    if kind == "far":
+        _transcribe = functools.partial(_apply_fst, _load_far(location))
+        return
+    module = _import_revision(location) if kind == "revision" else g2p
+    if hasattr(module, "warmup"):
+        module.warmup()
+    _transcribe = functools.partial(_apply, module)
+
+
+def _transcribe_chunk(words: List[str]) -> List[Optional[str]]:
+    return _transcribe(words)
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"{key}.tsv")
+
+
+def _read_cache(
+    cache_dir: Optional[str], key: Optional[str]
+) -> Dict[str, Optional[str]]:
+    outputs: Dict[str, Optional[str]] = {}
+    if cache_dir is None or key is None:
+        return outputs
+    path = _cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return outputs
+    with open(path, "r", encoding="utf8") as source:
+        for line in source:
+            # A partial last line was cut short by an interrupted write.
+            if not line.endswith("\n"):
+                break
+            # Words which could not be transcribed have no second column.
+            word, tab, ostring = line[:-1].partition("\t")
+            outputs[word] = ostring if tab else None
+    return outputs
+
+
+def _write_cache(
+    cache_dir: Optional[str],
+    key: Optional[str],
+    outputs: Iterable[Tuple[str, Optional[str]]],
+) -> None:
+    if cache_dir is None or key is None:
+        return
+    lines = "".join(
+        f"{word}\n" if ostring is None else f"{word}\t{ostring}\n"
+        for word, ostring in outputs
+    )
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(_cache_path(cache_dir, key), "a", encoding="utf8") as sink:
+            sink.write(lines)
+    except OSError:
+        pass
+
+
+def transcribe(
+    grammars: Sequence[Grammar],
+    words: Sequence[str],
+    processes: Optional[int] = None,
+    cache_dir: Optional[str] = CACHE_DIR,
+) -> List[Dict[str, Optional[str]]]:
+    """Transcribes words with several grammars at once.
+
+    Args:
+      grammars: the grammars.
+      words: the distinct graphemic input strings.
+      processes: the number of worker processes for each grammar; defaults
+        to an even share of the CPU count.
+      cache_dir: the directory for cached outputs, or None.
+
+    Returns:
+      For each grammar, a mapping from each word to its transcription, or
+      None if it could not be transcribed.
+    """
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // len(grammars))
+    outputs = [_read_cache(cache_dir, grammar.key) for grammar in grammars]
+    pending = [
+        [word for word in words if word not in cached] for cached in outputs
+    ]
+    with contextlib.ExitStack() as stack:
+        results = []
+        for grammar, todo in zip(grammars, pending):
+            if not todo:
+                results.append([])
+                continue
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    processes,
+                    initializer=_init_worker,
+                    initargs=(grammar.kind, grammar.location),
+                )
+            )
+            # The pools all start work here; results are collected below.
+            results.append(
+                pool.imap(
+                    _transcribe_chunk,
+                    [
+                        todo[start : start + CHUNK_SIZE]
+                        for start in range(0, len(todo), CHUNK_SIZE)
+                    ],
+                )
+            )
+        for grammar, todo, chunks, cached in zip(
+            grammars, pending, results, outputs
+        ):
+            new = list(
+                zip(todo, (ostring for chunk in chunks for ostring in chunk))
+            )
+            cached.update(new)
+            _write_cache(cache_dir, grammar.key, new)
+    return outputs
+
+
+def _changes(
+    baseline: Optional[str], candidate: Optional[str]
+) -> Set[Tuple[Optional[str], Optional[str]]]:
+    """Aligns two transcriptions by phoneme, returning what differs."""
+    if baseline is None or candidate is None:
+        return {
+            (
+                None if baseline is None else ANY,
+                None if candidate is None else ANY,
+            )
+        }
+    before = g2p.segment(baseline)
+    after = g2p.segment(candidate)
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    return {
+        ("".join(before[i1:i2]), "".join(after[j1:j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    }
+
+
+def diff(
+    words: Iterable[str],
+    baseline: str,
+    candidate: Optional[str] = None,
+    processes: Optional[int] = None,
+    cache_dir: Optional[str] = CACHE_DIR,
+    examples: int = EXAMPLES,
+) -> Diff:
+    """Compares the transcriptions of two grammars over a corpus.
+
+    Args:
+      words: the corpus.
+      baseline: the path of a FAR file, or a git revision.
+      candidate: the path of a FAR file, a git revision, or None for the
+        working tree.
+      processes: the number of worker processes for each grammar; defaults
+        to an even share of the CPU count.
+      cache_dir: the directory for cached outputs, or None.
+      examples: the most examples to give for each change; the most
+        frequent words are given.
+
+    Returns:
+      The differences.
+
+    Raises:
+      ValueError: a grammar is neither a file nor a revision.
+    """
+    counts = collections.Counter(words)
+    distinct = list(counts)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        grammars = [resolve(baseline, tmp_dir), resolve(candidate, tmp_dir)]
+        before, after = transcribe(grammars, distinct, processes, cache_dir)
+    changed: Dict[
+        Tuple[Optional[str], Optional[str]],
+        List[Tuple[str, Optional[str], Optional[str]]],
+    ] = collections.defaultdict(list)
+    changed_words = changed_distinct_words = 0
+    for word in distinct:
+        if before[word] == after[word]:
+            continue
+        changed_words += counts[word]
+        changed_distinct_words += 1
+        for key in _changes(before[word], after[word]):
+            changed[key].append((word, before[word], after[word]))
+    changes = []
+    for (baseline_phonemes, candidate_phonemes), rows in changed.items():
+        rows.sort(key=lambda row: -counts[row[0]])
+        changes.append(
+            Change(
+                baseline_phonemes,
+                candidate_phonemes,
+                len(rows),
+                sum(counts[word] for word, _, _ in rows),
+                rows[:examples],
+            )
+        )
+    changes.sort(key=lambda change: (-change.tokens, -change.words))
+    return Diff(
+        grammars[0].name,
+        grammars[1].name,
+        sum(counts.values()),
+        len(distinct),
+        changed_words,
+        changed_distinct_words,
+        changes,
+    )
+
+
+def _show(fragment: Optional[str]) -> str:
+    if fragment is None:
+        return "(failure)"
+    return fragment or "∅"
+
+
+def format_diff(result: Diff) -> str:
+    """Formats differences as a summary and a table of changes.
+
+    Args:
+      result: the differences, as returned by `diff`.
+
+    Returns:
+      The report.
+    """
+    lines = [
+        f"{result.baseline} -> {result.candidate}: "
+        f"{result.changed_words} of {result.words} words changed "
+        f"({result.changed_distinct_words} of {result.distinct_words} "
+        f"distinct)"
+    ]
+    if not result.changes:
+        return lines[0]
+    rows = [("baseline", "candidate", "words", "tokens", "examples")]
+    for change in result.changes:
+        rows.append(
+            (
+                _show(change.baseline),
+                _show(change.candidate),
+                str(change.words),
+                str(change.tokens),
+                ", ".join(
+                    f"{word} ({before or '(failure)'} -> "
+                    f"{after or '(failure)'})"
+                    for word, before, after in change.examples
+                ),
+            )
+        )
+    lines.append("")
+    lines.append(tables.format_table(rows, right=(2, 3)))
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline", help="FAR file or git revision")
+    parser.add_argument(
+        "candidate",
+        nargs="?",
+        help="FAR file or git revision; defaults to the working tree",
+    )
+    parser.add_argument(
+        "--corpus",
+        default=JPD_PATH,
+        help="TSV or word list file, or synthetic:N[:SEED]",
+    )
+    parser.add_argument(
+        "--processes", type=int, help="worker processes per grammar"
+    )
+    parser.add_argument(
+        "--examples",
+        type=int,
+        default=EXAMPLES,
+        help="examples reported per change",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="do not use cached outputs"
+    )
+    args = parser.parse_args()
+    try:
+        result = diff(
+            bulk.read_words(args.corpus),
+            args.baseline,
+            args.candidate,
+            args.processes,
+            None if args.no_cache else CACHE_DIR,
+            args.examples,
+        )
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    print(format_diff(result))
+    return 1 if result.changes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
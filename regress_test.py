@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Unit tests for differential regression testing."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pynini
+from pynini import cdrewrite
+
+import g2p
+import regress
+
+WORDS = ["さき", "さき", "ことし", "きゃく", "abc"]
+
+
+class RegressTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "outputs")
+        fst = g2p.build()
+        self.same = os.path.join(self.tmp_dir, "same.far")
+        g2p.save(fst, self.same)
+        self.changed = os.path.join(self.tmp_dir, "changed.far")
+        g2p.save(
+            fst
+            @ cdrewrite(g2p.cross_symbols("ɑ", "a"), "", "", g2p.SIGMA_STAR),
+            self.changed,
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def diff(self, baseline, candidate=None) -> regress.Diff:
+        return regress.diff(
+            WORDS, baseline, candidate, processes=1, cache_dir=self.cache_dir
+        )
+
+    def test_no_changes(self) -> None:
+        result = self.diff(self.same)
+        self.assertEqual((result.words, result.distinct_words), (5, 4))
+        self.assertEqual(result.changed_words, 0)
+        self.assertEqual(result.changes, [])
+
+    def test_changes(self) -> None:
+        result = self.diff(self.same, self.changed)
+        self.assertEqual(
+            (result.changed_words, result.changed_distinct_words), (2, 1)
+        )
+        self.assertEqual(
+            result.changes,
+            [regress.Change("ɑ", "a", 1, 2, [("さき", "sɑki̥", "saki̥")])],
+        )
+        self.assertIn("(1 of 4 distinct)", regress.format_diff(result))
+
+    def test_cache(self) -> None:
+        first = self.diff(self.changed)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertEqual(self.diff(self.changed), first)
+        key = regress.resolve(self.changed, self.tmp_dir).key
+        cached = regress._read_cache(self.cache_dir, key)
+        self.assertEqual(cached["さき"], "saki̥")
+        self.assertIsNone(cached["abc"])
+
+    def test_cache_round_trip(self) -> None:
+        regress._write_cache(self.cache_dir, "test", [("a", ""), ("b", None)])
+        self.assertEqual(
+            regress._read_cache(self.cache_dir, "test"), {"a": "", "b": None}
+        )
+
+    def test_cache_key(self) -> None:
+        key = regress.resolve(self.same, self.tmp_dir).key
+        self.assertNotEqual(
+            regress.resolve(self.changed, self.tmp_dir).key, key
+        )
+        g2p.set_input_policy("repair")
+        try:
+            self.assertNotEqual(
+                regress.resolve(self.same, self.tmp_dir).key, key
+            )
+        finally:
+            g2p.set_input_policy("raise")
+
+    def test_byte_labelled_archive(self) -> None:
+        path = os.path.join(self.tmp_dir, "bytes.far")
+        g2p.save(pynini.string_map([("さき", "sɑki̥")]), path)
+        self.assertEqual(
+            regress._apply_fst(regress._load_far(path), ["さき", "ことし"]),
+            ["sɑki̥", None],
+        )
+
+    def test_revision(self) -> None:
+        grammar = regress.resolve("HEAD", self.tmp_dir)
+        self.assertEqual(grammar.kind, "revision")
+        self.assertTrue(
+            os.path.exists(os.path.join(grammar.location, "g2p.py"))
+        )
+        result = self.diff("HEAD", self.changed)
+        self.assertEqual(result.changes[0][:2], ("ɑ", "a"))
+
+    def test_unknown_grammar(self) -> None:
+        with self.assertRaises(ValueError):
+            regress.resolve("no-such-revision", self.tmp_dir)
+
+
+class ChangesTest(unittest.TestCase):
+    def test_changes(self) -> None:
+        self.assertEqual(
+            regress._changes("kɑtɑkɑnɑ", "katakana"), {("ɑ", "a")}
+        )
+        self.assertEqual(regress._changes("kõɴbãɴ", "kõmbãɴ"), {("ɴ", "m")})
+        self.assertEqual(regress._changes(None, "a"), {(None, regress.ANY)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+"""Rule-firing coverage of the Hiragana G2P cascade over a corpus.
+
+Reports, for each stage of `g2p.STAGES` and each entry of its mapping, how
+many words of a corpus it applied to, and how often, so that dead rules can
+be pruned and hot ones prioritized. Entries whose input repeats an earlier
+entry of the same stage are reported as duplicates; they can never fire.
+
+Each stage is applied in turn with a tagged copy of its rule, in which each
+entry's output is followed by a label of its own; counting those labels and
+deleting them gives the entries applied and the input to the next stage. The
+final output is checked against `g2p.g2p_batch`; words for which it differs
+are counted, but not attributed to any entry. Each distinct word is only
+transcribed once, weighted by its frequency, and the work can be spread over
+worker processes.
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+from typing import (
+    Counter,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from pynini import (
+    NO_STATE_ID,
+    Arc,
+    Fst,
+    Weight,
+    cdrewrite,
+    closure,
+    compose,
+    shortestpath,
+    union,
+)
+
+import bulk
+import g2p
+import tables
+
+JPD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jpd.tsv")
+
+# Entry tags are labelled from here, above any label in `g2p.SYMBOLS`.
+TAG_BASE = 1 << 20
+
+CHUNK_SIZE = 1024
+
+
+class Entry(NamedTuple):
+    """One mapping entry of a stage."""
+
+    stage: str
+    index: int
+    istring: str
+    ostring: str
+    duplicate_of: Optional[int]
+
+
+class EntryCoverage(NamedTuple):
+    """How often an entry applied: in how many words, and in total."""
+
+    entry: Entry
+    words: int
+    applications: int
+
+
+class Coverage(NamedTuple):
+    """The coverage of the cascade over a corpus."""
+
+    words: int
+    distinct_words: int
+    failed: int
+    unattributed: int
+    entries: List[EntryCoverage]
+
+    def stage_applications(self) -> Dict[str, int]:
+        """Returns the total applications of each stage, in cascade order."""
+        totals: Dict[str, int] = {name: 0 for name, _, _, _ in g2p.STAGES}
+        for coverage in self.entries:
+            totals[coverage.entry.stage] += coverage.applications
+        return totals
+
+
+def stage_entries(stage: Tuple[str, Fst, object, object]) -> List[Entry]:
+    """Lists the mapping entries of a stage.
+
+    Stages compiled from one of the rule tables in `g2p`, which share its
+    name, list its entries in table order; other stages list the paths of
+    their rule.
+
+    Args:
+      stage: a (name, rule, left context, right context) tuple.
+
+    Returns:
+      The entries.
+    """
+    name, tau, _, _ = stage
+    table = getattr(g2p, name, None)
+    if isinstance(table, list):
+        pairs = list(table)
+    else:
+        pairs = [
+            ("".join(istring.split()), "".join(ostring.split()))
+            for istring, ostring, _ in tau.paths(
+                input_token_type=g2p.SYMBOLS, output_token_type=g2p.SYMBOLS
+            ).items()
+        ]
+    first: Dict[str, int] = {}
+    entries = []
+    for index, (istring, ostring) in enumerate(pairs):
+        duplicate_of = first.setdefault(istring, index)
+        entries.append(
+            Entry(
+                name,
+                index,
+                istring,
+                ostring,
+                None if duplicate_of == index else duplicate_of,
+            )
+        )
+    return entries
+
+
+def _tag(label: int) -> Fst:
+    """Returns a transducer which inserts the label."""
+    fst = Fst()
+    start = fst.add_state()
+    final = fst.add_state()
+    fst.set_start(start)
+    fst.set_final(final)
+    fst.add_arc(start, Arc(0, label, Weight.one(fst.weight_type()), final))
+    return fst
+
+
+def _linear(labels: Sequence[int]) -> Fst:
+    fst = Fst()
+    state = fst.add_state()
+    fst.set_start(state)
+    one = Weight.one(fst.weight_type())
+    for label in labels:
+        nextstate = fst.add_state()
+        fst.add_arc(state, Arc(label, label, one, nextstate))
+        state = nextstate
+    fst.set_final(state)
+    return fst
+
+
+def _output_labels(path: Fst) -> List[int]:
+    labels = []
+    state = path.start()
+    while state != NO_STATE_ID:
+        arcs = list(path.arcs(state))
+        if not arcs:
+            break
+        arc = arcs[0]
+        if arc.olabel:
+            labels.append(arc.olabel)
+        state = arc.nextstate
+    return labels
+
+
+class Profiler:
+    """Applies the cascade with tagged rules; see the module docstring."""
+
+    def __init__(self):
+        self.entries: List[Entry] = []
+        self.rules: List[Fst] = []
+        for stage in g2p.STAGES:
+            _, _, left, right = stage
+            taus = []
+            tags = []
+            for entry in stage_entries(stage):
+                if entry.duplicate_of is None:
+                    tag = _tag(TAG_BASE + len(self.entries))
+                    taus.append(
+                        g2p.cross_symbols(entry.istring, entry.ostring) + tag
+                    )
+                    tags.append(tag.project("output"))
+                self.entries.append(entry)
+            # Rules only rewrite into their alphabet, so it includes the tags.
+            sigma_star = closure(union(g2p.SIGMA_STAR, *tags)).optimize()
+            rule = cdrewrite(union(*taus), left, right, sigma_star)
+            self.rules.append(rule.optimize().arcsort("ilabel"))
+
+    def profile(self, word: str) -> Optional[Tuple[str, Counter[int]]]:
+        """Applies the tagged cascade to a word.
+
+        Args:
+          word: the graphemic input string.
+
+        Returns:
+          The output, and how often each entry, by index, applied; or None if
+          the word could not be transcribed.
+        """
+        try:
+            lattice = g2p.compile_input(word)
+        except g2p.rewrite.Error:
+            return None
+        fired: Counter[int] = collections.Counter()
+        for rule in self.rules:
+            path = compose(lattice, rule)
+            if path.start() == NO_STATE_ID:
+                return None
+            labels = []
+            for label in _output_labels(shortestpath(path)):
+                if label >= TAG_BASE:
+                    fired[label - TAG_BASE] += 1
+                else:
+                    labels.append(label)
+            lattice = _linear(labels)
+        return "".join(g2p.SYMBOLS.find(label) for label in labels), fired
+
+
+_profiler: Optional[Profiler] = None
+
+
+def _init_worker() -> None:
+    global _profiler
+    _profiler = Profiler()
+
+
+def _profile_chunk(
+    words: List[str],
+) -> List[Optional[Tuple[str, Counter[int]]]]:
+    return [_profiler.profile(word) for word in words]
+
+
+def coverage(
+    words: Iterable[str], processes: Optional[int] = None
+) -> Coverage:
+    """Measures how often each entry of each stage applies over a corpus.
+
+    Args:
+      words: the corpus.
+      processes: if set, profile across this many worker processes.
+
+    Returns:
+      The coverage.
+    """
+    counts = collections.Counter(words)
+    distinct = list(counts)
+    expected = g2p.g2p_batch(distinct)
+    chunks = [
+        distinct[start : start + CHUNK_SIZE]
+        for start in range(0, len(distinct), CHUNK_SIZE)
+    ]
+    if processes:
+        with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+            profiled = [
+                result
+                for chunk in pool.imap(_profile_chunk, chunks)
+                for result in chunk
+            ]
+        entries = Profiler().entries
+    else:
+        _init_worker()
+        profiled = [
+            result for chunk in chunks for result in _profile_chunk(chunk)
+        ]
+        entries = _profiler.entries
+    word_counts: Counter[int] = collections.Counter()
+    applications: Counter[int] = collections.Counter()
+    failed = unattributed = 0
+    for word, result, reference in zip(distinct, profiled, expected):
+        count = counts[word]
+        if isinstance(reference, g2p.rewrite.Error):
+            failed += count
+            continue
+        if result is None or result[0] != reference:
+            unattributed += count
+            continue
+        for index, times in result[1].items():
+            word_counts[index] += count
+            applications[index] += times * count
+    return Coverage(
+        sum(counts.values()),
+        len(distinct),
+        failed,
+        unattributed,
+        [
+            EntryCoverage(entry, word_counts[i], applications[i])
+            for i, entry in enumerate(entries)
+        ],
+    )
+
+
+def format_coverage(result: Coverage) -> str:
+    """Formats coverage as a table, with a summary.
+
+    Args:
+      result: the coverage, as returned by `coverage`.
+
+    Returns:
+      The report.
+    """
+    rows = [("stage", "#", "input", "output", "words", "applications", "")]
+    for row in result.entries:
+        entry = row.entry
+        if entry.duplicate_of is not None:
+            note = f"duplicate of #{entry.duplicate_of}"
+        elif not row.applications:
+            note = "dead"
+        else:
+            note = ""
+        rows.append(
+            (
+                entry.stage,
+                str(entry.index),
+                entry.istring,
+                entry.ostring,
+                str(row.words),
+                str(row.applications),
+                note,
+            )
+        )
+    lines = [tables.format_table(rows, right=(1, 4, 5))]
+    dead = sum(
+        1
+        for row in result.entries
+        if not row.applications and row.entry.duplicate_of is None
+    )
+    duplicates = sum(
+        1 for row in result.entries if row.entry.duplicate_of is not None
+    )
+    lines.append("")
+    lines.append(
+        f"{result.words} words ({result.distinct_words} distinct), "
+        f"{result.failed} failed, {result.unattributed} unattributed; "
+        f"{dead} dead and {duplicates} duplicate entries"
+    )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "corpus",
+        nargs="?",
+        default=JPD_PATH,
+        help="TSV or word list file, or synthetic:N[:SEED]",
+    )
+    parser.add_argument(
+        "--processes", type=int, help="profile across worker processes"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="report the results as JSON"
+    )
+    args = parser.parse_args()
+    result = coverage(bulk.read_words(args.corpus), args.processes)
+    if args.json:
+        json.dump(
+            {
+                "words": result.words,
+                "distinct_words": result.distinct_words,
+                "failed": result.failed,
+                "unattributed": result.unattributed,
+                "entries": [
+                    dict(
+                        row.entry._asdict(),
+                        words=row.words,
+                        applications=row.applications,
+                    )
+                    for row in result.entries
+                ],
+            },
+            sys.stdout,
+            ensure_ascii=False,
+            indent=2,
+        )
+        print()
+    else:
+        print(format_coverage(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Unit tests for rule-firing coverage."""
+
+import unittest
+
+import g2p
+import rule_coverage
+
+
+def _applied(result: rule_coverage.Coverage):
+    return {
+        (row.entry.stage, row.entry.istring): (row.words, row.applications)
+        for row in result.entries
+        if row.applications
+    }
+
+
+class StageEntriesTest(unittest.TestCase):
+    def test_table_stage(self) -> None:
+        stage = next(s for s in g2p.STAGES if s[0] == "digraph_map")
+        entries = rule_coverage.stage_entries(stage)
+        self.assertEqual(len(entries), len(g2p.digraph_map))
+        self.assertEqual(entries[0].istring, g2p.digraph_map[0][0])
+
+    def test_duplicates(self) -> None:
+        stage = next(s for s in g2p.STAGES if s[0] == "long_vowel_map")
+        entries = rule_coverage.stage_entries(stage)
+        for entry in entries:
+            if entry.duplicate_of is not None:
+                self.assertEqual(
+                    entries[entry.duplicate_of].istring, entry.istring
+                )
+                self.assertLess(entry.duplicate_of, entry.index)
+
+    def test_stage_without_table(self) -> None:
+        stage = next(s for s in g2p.STAGES if s[0] == "wa")
+        entries = rule_coverage.stage_entries(stage)
+        self.assertEqual([e.istring for e in entries], ["は"])
+
+
+class CoverageTest(unittest.TestCase):
+    def test_coverage(self) -> None:
+        result = rule_coverage.coverage(["じか", "じか", "きゃく", "abc"])
+        self.assertEqual((result.words, result.distinct_words), (4, 3))
+        self.assertEqual((result.failed, result.unattributed), (1, 0))
+        self.assertEqual(
+            _applied(result),
+            {
+                ("digraph_map", "きゃ"): (1, 1),
+                ("monograph_bos_map", "じ"): (2, 2),
+                ("context_free_map", "か"): (2, 2),
+                ("context_free_map", "く"): (1, 1),
+                ("devoicing_map", "ɯ"): (1, 1),
+            },
+        )
+        self.assertEqual(
+            sum(result.stage_applications().values()),
+            sum(row.applications for row in result.entries),
+        )
+
+    def test_processes(self) -> None:
+        words = ["じか", "きゃく", "ことし", "ぽう"]
+        self.assertEqual(
+            rule_coverage.coverage(words, processes=2),
+            rule_coverage.coverage(words),
+        )
+
+    def test_format_coverage(self) -> None:
+        report = rule_coverage.format_coverage(
+            rule_coverage.coverage(["じか"])
+        )
+        self.assertIn("dead", report)
+        self.assertIn(
+            "1 words (1 distinct), 0 failed, 0 unattributed;", report
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""Local HTTP server for Hiragana G2P with request micro-batching.
+
+The server holds one warm copy of the grammar. Concurrent requests are
+collected into micro-batches, each transcribed with a single `g2p.g2p_batch`
+call once it is full or its latency budget has elapsed.
+
+Endpoints:
+  POST /g2p: the body is a JSON object `{"words": [...]}`; the response is
+    `{"results": [...]}` with, for each word, an object with the keys "word",
+    "ipa" and, if it could not be transcribed, "error".
+  GET /health: responds `{"status": "ok"}` while the server is accepting
+    requests.
+"""
+
+import argparse
+import json
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple, Union
+
+import g2p
+
+MAX_BATCH = 256
+MAX_DELAY = 0.002
+REQUEST_TIMEOUT = 5.0
+
+
+class ClosedError(RuntimeError):
+    """A word was submitted to a `Batcher` after it was closed."""
+
+    pass
+
+
+class Batcher:
+    """Collects transcription requests from many threads into batches.
+
+    Args:
+      max_batch: the most words transcribed in one batch.
+      max_delay: the longest, in seconds, the first word of a batch waits for
+        others to join it.
+    """
+
+    def __init__(
+        self, max_batch: int = MAX_BATCH, max_delay: float = MAX_DELAY
+    ):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = (
+            queue.Queue()
+        )
+        # Guards `_closed`, so that nothing is queued after the sentinel.
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, word: str) -> "Future[Union[str, g2p.rewrite.Error]]":
+        """Queues a word for transcription.
+
+        Args:
+          word: the graphemic input string.
+
+        Returns:
+          A future for the output string or the `rewrite.Error` raised.
+
+        Raises:
+          ClosedError: the batcher has been closed.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise ClosedError("The batcher is closed")
+            self._queue.put((word, future))
+        return future
+
+    def close(self) -> None:
+        """Transcribes any queued words, then stops the batching thread.
+
+        Words submitted afterwards are refused.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            closing = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            self._transcribe(batch)
+            if closing:
+                return
+
+    @staticmethod
+    def _transcribe(batch: List[Tuple[str, Future]]) -> None:
+        try:
+            results = g2p.g2p_batch(word for word, _ in batch)
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "Server"
+
+    def setup(self) -> None:
+        # Bounds how long an idle or slow client can hold its handler thread,
+        # which the server joins on close.
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._respond(200, {"status": "ok"})
+        else:
+            self._respond(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/g2p":
+            self._respond(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            words = json.loads(self.rfile.read(length))["words"]
+            if not isinstance(words, list) or not all(
+                isinstance(word, str) for word in words
+            ):
+                raise ValueError("Words must be a list of strings")
+        except (KeyError, TypeError, ValueError) as error:
+            self._respond(400, {"error": str(error)})
+            return
+        try:
+            futures = [self.server.batcher.submit(word) for word in words]
+        except ClosedError as error:
+            self._respond(503, {"error": str(error)})
+            return
+        results = []
+        for word, future in zip(words, futures):
+            result = future.result()
+            if isinstance(result, g2p.rewrite.Error):
+                results.append(
+                    {"word": word, "ipa": None, "error": str(result)}
+                )
+            else:
+                results.append({"word": word, "ipa": result})
+        self._respond(200, {"results": results})
+
+    def _respond(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    """An HTTP server backed by a `Batcher`.
+
+    Args:
+      address: the (host, port) to listen on; port 0 picks a free port.
+      max_batch: the most words transcribed in one batch.
+      max_delay: the micro-batching latency budget, in seconds.
+      request_timeout: the longest, in seconds, a connection may wait on the
+        client before it is dropped.
+    """
+
+    # Handler threads are joined on close, before the batcher is closed, so
+    # requests in flight are answered; `request_timeout` bounds the wait.
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        max_batch: int = MAX_BATCH,
+        max_delay: float = MAX_DELAY,
+        request_timeout: float = REQUEST_TIMEOUT,
+    ):
+        g2p.warmup()
+        self.request_timeout = request_timeout
+        self.batcher = Batcher(max_batch, max_delay)
+        super().__init__(address, _Handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.batcher.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="port to bind")
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=MAX_BATCH,
+        help="most words transcribed in one batch",
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=MAX_DELAY * 1000,
+        help="micro-batching latency budget, in milliseconds",
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        default=REQUEST_TIMEOUT,
+        help="seconds to wait on a client before dropping its connection",
+    )
+    args = parser.parse_args()
+    server = Server(
+        (args.host, args.port),
+        args.max_batch,
+        args.max_delay / 1000,
+        args.request_timeout,
+    )
+
+    def stop(signum, frame) -> None:
+        # `shutdown` blocks until `serve_forever` returns, so it cannot be
+        # called from the serving thread itself.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Unit tests for the G2P server."""
+
+import json
+import socket
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import g2p
+import server
+
+
+class BatcherTest(unittest.TestCase):
+    def test_batches_concurrent_words(self) -> None:
+        batcher = server.Batcher(max_batch=4, max_delay=0.05)
+        try:
+            futures = [
+                batcher.submit(word) for word in ("じか", "abc", "げんか")
+            ]
+            results = [future.result() for future in futures]
+        finally:
+            batcher.close()
+        self.assertEqual(results[0], "dʑikɑ")
+        self.assertIsInstance(results[1], g2p.rewrite.Error)
+        self.assertEqual(results[2], "ɡẽɴkɑ")
+
+    def test_submit_after_close(self) -> None:
+        batcher = server.Batcher()
+        batcher.close()
+        with self.assertRaises(server.ClosedError):
+            batcher.submit("じか")
+        batcher.close()
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = server.Server(("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def post(self, words) -> dict:
+        request = urllib.request.Request(
+            f"{self.url}/g2p",
+            data=json.dumps({"words": words}).encode("utf8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def _wait_for_handler(self) -> None:
+        deadline = time.monotonic() + 10
+        while not any(
+            "process_request_thread" in thread.name
+            for thread in threading.enumerate()
+        ):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_health(self) -> None:
+        with urllib.request.urlopen(f"{self.url}/health") as response:
+            self.assertEqual(json.loads(response.read()), {"status": "ok"})
+
+    def test_g2p(self) -> None:
+        results = self.post(["じか", "abc"])["results"]
+        self.assertEqual(results[0], {"word": "じか", "ipa": "dʑikɑ"})
+        self.assertIsNone(results[1]["ipa"])
+        self.assertIn("error", results[1])
+
+    def test_concurrent_requests(self) -> None:
+        words = ["げんか", "ことし", "じか", "そっこん"] * 8
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(lambda w: self.post([w]), words))
+        for word, response in zip(words, responses):
+            self.assertEqual(response["results"][0]["ipa"], g2p.g2p(word))
+
+    def test_shutdown_with_request_in_flight(self) -> None:
+        body = json.dumps({"words": ["じか"]}).encode("utf8")
+        host, port = self.server.server_address
+        with socket.create_connection((host, port), timeout=10) as client:
+            client.sendall(
+                b"POST /g2p HTTP/1.1\r\n"
+                + f"Host: {host}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            )
+            self._wait_for_handler()
+            self.server.shutdown()
+            self.thread.join()
+            closing = threading.Thread(target=self.server.server_close)
+            closing.start()
+            client.sendall(body)
+            response = b""
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                response += data
+            closing.join()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.0 200"))
+        self.assertEqual(
+            json.loads(payload)["results"][0], {"word": "じか", "ipa": "dʑikɑ"}
+        )
+
+    def test_shutdown_with_idle_connection(self) -> None:
+        self.server.request_timeout = 0.2
+        host, port = self.server.server_address
+        with socket.create_connection((host, port), timeout=10):
+            self._wait_for_handler()
+            self.server.shutdown()
+            self.thread.join()
+            closing = threading.Thread(target=self.server.server_close)
+            closing.start()
+            closing.join(10)
+            self.assertFalse(closing.is_alive())
+
+    def test_bad_request(self) -> None:
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.post("じか")
+        self.assertEqual(context.exception.code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""Plain-text tables for the reports of the command-line tools."""
+
+from typing import Container, Sequence
+
+
+def format_table(
+    rows: Sequence[Sequence[str]], right: Container[int] = ()
+) -> str:
+    """Formats rows of cells as aligned columns.
+
+    Columns are separated by two spaces, and trailing spaces are removed from
+    each line.
+
+    Args:
+      rows: the rows, starting with the header; all have the same length.
+      right: the indices of the columns to align right, such as counts; the
+        others are aligned left.
+
+    Returns:
+      The table.
+    """
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(
+            cell.rjust(width) if i in right else cell.ljust(width)
+            for i, (cell, width) in enumerate(zip(row, widths))
+        ).rstrip()
+        for row in rows
+    )
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+"""Unit tests for plain-text tables."""
+
+import unittest
+
+import tables
+
+
+class FormatTableTest(unittest.TestCase):
+    def test_format_table(self) -> None:
+        self.assertEqual(
+            tables.format_table(
+                [
+                    ("stage", "words", "note"),
+                    ("wa", "12", ""),
+                    ("a", "3", "x"),
+                ],
+                right={1},
+            ),
+            "stage  words  note\nwa        12\na          3  x",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()